@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Usage: bench_latency.py [options]
+
+Measures the latency of Tagger.tag_within on synthetic documents of growing
+size (up to 10MB) for a few time budgets, reporting the percentiles of the
+latency and the degradation levels used, next to the latency of a plain
+call. Exits with status 1 if the p99 latency exceeds a budget by more than
+the tolerance.
+
+The smallest default budget (5ms) is below the cost of reading and stemming
+the probe that Tagger.tag_within uses to estimate the cost of a document, so
+the latency must stay bounded even when the probe can't be completed.
+'''
+
+import gc
+import glob
+import math
+import os
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from tagger import Reader, Stemmer, Rater, Tagger
+from tagger.weights import load_weights
+
+from bench_pipeline import SIZES, synthetic_text
+
+
+def percentile(values, p):
+    values = sorted(values)
+    rank = max(int(math.ceil(p / 100.0 * len(values))), 1)
+    return values[rank - 1]
+
+
+def run(options):
+    tagger = Tagger(Reader(), Stemmer(), Rater(load_weights(options.dictionary)))
+
+    paragraphs = []
+    for doc in sorted(glob.glob('tests/*.txt')):
+        with open(doc, 'r') as file:
+            paragraphs += [par for par in file.read().split('\n')
+                           if par.strip()]
+
+    # warm-up (the stemmer is only loaded when first needed, and
+    # Tagger.tag_within measures the cost of the rater on its first calls)
+    tagger(paragraphs[0])
+    for paragraph in paragraphs[:10]:
+        tagger.tag_within(paragraph, seconds=1.0)
+    # the dictionary and the modules loaded so far live as long as the
+    # process: they are moved out of the way of the garbage collector, whose
+    # full collections would otherwise take tens of ms in the middle of a
+    # budget (as a long-running server should do after loading)
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+    failures = []
+
+    for name, size in SIZES:
+        if size > options.max_size:
+            continue
+        text = synthetic_text(paragraphs, size)
+
+        if options.plain:
+            start = time.perf_counter()
+            tagger(text)
+            print('%-6s %-12s %8.1f ms' % (name, 'unbounded',
+                                          (time.perf_counter() - start) * 1e3))
+
+        for budget in options.budgets:
+            latencies = []
+            levels = {}
+            for _ in range(options.repeat):
+                start = time.perf_counter()
+                tags, level = tagger.tag_within(text, seconds=budget / 1e3)
+                latencies.append((time.perf_counter() - start) * 1e3)
+                levels[level] = levels.get(level, 0) + 1
+
+            p99 = percentile(latencies, 99)
+            print('%-6s %-12s %8.1f ms p50 %8.1f ms p99  %s  %s' % (
+                name, 'budget %gms' % budget, percentile(latencies, 50), p99,
+                ' '.join('%s:%d' % item for item in sorted(levels.items())),
+                [t.string for t in tags]))
+            if p99 > budget * (1 + options.tolerance):
+                failures.append('%s: p99 %.1f ms over a budget of %g ms' % (
+                    name, p99, budget))
+
+    return failures
+
+
+if __name__ == '__main__':
+
+    parser = OptionParser(usage=__doc__.strip())
+    parser.add_option("", "--dict", dest="dictionary", default="data/dict.pkl",
+                      action="store", type="string", metavar="DICT",
+                      help="dictionary for weights (pickled or binary)")
+    parser.add_option("", "--max_size", dest="max_size", default=10 << 20,
+                      action="store", type="int", metavar="BYTES",
+                      help="size of the largest synthetic document")
+    parser.add_option("", "--budget", dest="budgets", default=[],
+                      action="append", type="float", metavar="MS",
+                      help="time budget in milliseconds (can be repeated; "
+                           "defaults to 5, 20, 100 and 500)")
+    parser.add_option("", "--repeat", dest="repeat", default=100,
+                      action="store", type="int", metavar="N",
+                      help="runs per document and budget")
+    parser.add_option("", "--tolerance", dest="tolerance", default=0.25,
+                      action="store", type="float", metavar="FRACTION",
+                      help="allowed excess of the p99 latency over a budget")
+    parser.add_option("", "--no_plain", dest="plain", default=True,
+                      action="store_false",
+                      help="don't time the plain tagger (slow on 10MB)")
+
+    (options, args) = parser.parse_args()
+    options.budgets = options.budgets or [5.0, 20.0, 100.0, 500.0]
+
+    failures = run(options)
+    for failure in failures:
+        print('OVER BUDGET ' + failure)
+    sys.exit(1 if failures else 0)
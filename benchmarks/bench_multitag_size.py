@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Usage: bench_multitag_size.py [options]
+
+Times the Rater on the documents in tests/ for each value of multitag_size
+'''
+
+import glob
+import os
+import pickle
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from tagger import Reader, Rater, Stemmer
+
+
+if __name__ == '__main__':
+
+    parser = OptionParser(usage=__doc__.strip())
+    parser.add_option("", "--dict", dest="dictionary", default="data/dict.pkl",
+                      action="store", type="string", metavar="DICT",
+                      help="pickled dictionary for weights")
+    parser.add_option("", "--max_size", dest="max_size", default=6,
+                      action="store", type="int", metavar="TAG_SIZE",
+                      help="largest multitag_size to time")
+    parser.add_option("", "--repeat", dest="repeat", default=5,
+                      action="store", type="int", metavar="N",
+                      help="times each document is repeated")
+
+    (options, args) = parser.parse_args()
+
+    with open(options.dictionary, 'rb') as fh:
+        weights = pickle.load(fh)
+
+    reader = Reader()
+    stemmer = Stemmer()
+    documents = []
+    for doc in sorted(glob.glob('tests/*.txt')):
+        with open(doc, 'r') as file:
+            text = '\n'.join([file.read()] * options.repeat)
+        documents.append(list(map(stemmer, reader(text))))
+
+    tokens = sum(len(tags) for tags in documents)
+    print('%d documents, %d tokens' % (len(documents), tokens))
+    print('%-14s %10s %14s' % ('multitag_size', 'seconds', 'tokens/s'))
+
+    for size in range(1, options.max_size + 1):
+        rater = Rater(weights, multitag_size=size)
+        start = time.time()
+        for tags in documents:
+            rater(tags)
+        elapsed = time.time() - start
+        print('%-14d %10.3f %14.0f' % (size, elapsed, tokens / elapsed))
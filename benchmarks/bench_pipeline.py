@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Usage: bench_pipeline.py [options]
+
+Times every stage of the tagging pipeline (readers, stemmers, raters and the
+whole tagger) on the documents in tests/ and on synthetic documents of
+growing size, reporting throughput in tokens/s and peak memory.
+
+Results can be saved as a JSON baseline (--save) and later compared against
+it (--compare): the script exits with status 1 if a stage got slower or
+hungrier than the tolerance allows. Baselines are only comparable on the
+same machine: benchmarks/compare_reference.sh (used by the CI) saves one for
+a reference commit and compares the working tree with it in the same run.
+'''
+
+import glob
+import json
+import os
+import pickle
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from tagger import Reader, Stemmer, Rater, Tagger
+from tagger.tagger import Tag
+
+
+SIZES = [('1KB', 1 << 10), ('10KB', 10 << 10), ('100KB', 100 << 10),
+         ('1MB', 1 << 20), ('10MB', 10 << 20)]
+
+
+def synthetic_text(paragraphs, size, seed=0):
+    '''
+    @param paragraphs: a list of paragraphs of real text to sample from
+    @param size:       the size of the document, in characters
+
+    @returns: a document made of randomly chosen paragraphs
+    '''
+
+    rng = random.Random(seed)
+    chunks = []
+    length = 0
+    while length < size:
+        par = rng.choice(paragraphs)
+        chunks.append(par)
+        length += len(par) + 1
+    return '\n'.join(chunks)[:size]
+
+
+def to_html(text):
+    return '<html><body>%s</body></html>' % ''.join(
+        '<p>%s</p>' % par for par in text.split('\n'))
+
+
+def stem_all(stemmer):
+    # build the (lazily loaded) stemmer before timing it
+    stemmer(Tag('warm'))
+    return lambda tags: list(map(stemmer, tags))
+
+
+def stages(weights):
+    '''
+    @param weights: the dictionary of weights used by the raters
+
+    @returns: a list of (name, factory, input) triples, where the factory
+              builds the callable to be timed and the input is one of 'text',
+              'html', 'tags' (output of the Reader) or 'stemmed'
+    '''
+
+    from tagger.extras import (SimpleReader, UnicodeReader, HTMLReader,
+                               StreamingHTMLReader, FastStemmer, NaiveRater)
+
+    return [
+        ('Reader', Reader, 'text'),
+        ('SimpleReader', SimpleReader, 'text'),
+        ('UnicodeReader', UnicodeReader, 'text'),
+        ('HTMLReader', HTMLReader, 'html'),
+        ('StreamingHTMLReader', StreamingHTMLReader, 'html'),
+        ('Stemmer', lambda: stem_all(Stemmer()), 'tags'),
+        ('FastStemmer', lambda: stem_all(FastStemmer()), 'tags'),
+        ('Rater', lambda: Rater(weights), 'stemmed'),
+        ('NaiveRater', lambda: NaiveRater(weights), 'stemmed'),
+        ('Tagger', lambda: Tagger(Reader(), Stemmer(), Rater(weights)), 'text'),
+    ]
+
+
+def measure(function, argument, repeat, memory):
+    '''
+    @returns: the best time of the given number of runs, in seconds, and the
+              peak memory allocated by one run, in bytes (None if not
+              measured)
+    '''
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(argument)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        function(argument)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return best, peak
+
+
+def run(options):
+    with open(options.dictionary, 'rb') as fh:
+        weights = pickle.load(fh)
+
+    documents = []
+    for doc in sorted(glob.glob('tests/*.txt')):
+        with open(doc, 'r') as file:
+            documents.append((os.path.basename(doc), file.read()))
+
+    paragraphs = [par for name, text in documents
+                  for par in text.split('\n') if par.strip()]
+    for name, size in SIZES:
+        if size <= options.max_size:
+            documents.append(('synthetic-' + name,
+                              synthetic_text(paragraphs, size)))
+
+    results = {}
+    skipped = set()
+    stemmer = Stemmer()
+
+    for doc_name, text in documents:
+        tags = Reader()(text)
+        inputs = {'text': text, 'html': to_html(text), 'tags': tags,
+                  'stemmed': list(map(stemmer, Reader()(text)))}
+        repeat = options.repeat if len(text) < (1 << 20) else 1
+
+        for stage_name, factory, kind in stages(weights):
+            if ((options.stages and stage_name not in options.stages) or
+                    stage_name in skipped):
+                continue
+            try:
+                function = factory()
+                seconds, peak = measure(function, inputs[kind], repeat,
+                                        options.memory)
+            except (ImportError, SyntaxError) as e:
+                # optional dependencies (the 'stemming' package used by the
+                # FastStemmer only supports Python 2)
+                print('%-19s skipped (%s)' % (stage_name, e))
+                skipped.add(stage_name)
+                continue
+
+            result = {'seconds': seconds, 'tokens': len(tags),
+                      'tokens_per_s': len(tags) / seconds if seconds else None,
+                      'peak_bytes': peak}
+            results['%s/%s' % (stage_name, doc_name)] = result
+
+            print('%-19s %-22s %8d tokens %10.4f s %12.0f tokens/s %s' % (
+                stage_name, doc_name, len(tags), seconds,
+                result['tokens_per_s'] or 0,
+                '%10.1f KB' % (peak / 1024.0) if peak is not None else ''))
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    '''
+    @returns: a list of descriptions of the regressions found
+    '''
+
+    regressions = []
+
+    for key, old in sorted(baseline['results'].items()):
+        new = results.get(key)
+        if not new:
+            continue
+        if (old['tokens_per_s'] and new['tokens_per_s'] and
+                new['tokens_per_s'] < old['tokens_per_s'] * (1 - tolerance)):
+            regressions.append('%s: %.0f tokens/s (baseline %.0f)' % (
+                key, new['tokens_per_s'], old['tokens_per_s']))
+        if (old['peak_bytes'] and new['peak_bytes'] and
+                new['peak_bytes'] > old['peak_bytes'] * (1 + tolerance)):
+            regressions.append('%s: %d bytes peak (baseline %d)' % (
+                key, new['peak_bytes'], old['peak_bytes']))
+
+    return regressions
+
+
+if __name__ == '__main__':
+
+    parser = OptionParser(usage=__doc__.strip())
+    parser.add_option("", "--dict", dest="dictionary", default="data/dict.pkl",
+                      action="store", type="string", metavar="DICT",
+                      help="pickled dictionary for weights")
+    parser.add_option("", "--max_size", dest="max_size", default=10 << 20,
+                      action="store", type="int", metavar="BYTES",
+                      help="size of the largest synthetic document")
+    parser.add_option("", "--repeat", dest="repeat", default=3,
+                      action="store", type="int", metavar="N",
+                      help="runs per measure on documents under 1MB")
+    parser.add_option("", "--stage", dest="stages", default=[],
+                      action="append", type="string", metavar="STAGE",
+                      help="only time this stage (can be repeated)")
+    parser.add_option("", "--no_memory", dest="memory", default=True,
+                      action="store_false",
+                      help="don't measure peak memory (faster)")
+    parser.add_option("", "--save", dest="save", default=None,
+                      action="store", type="string", metavar="FILE",
+                      help="save the results as a JSON baseline")
+    parser.add_option("", "--compare", dest="compare", default=None,
+                      action="store", type="string", metavar="FILE",
+                      help="compare the results with a JSON baseline")
+    parser.add_option("", "--tolerance", dest="tolerance", default=0.25,
+                      action="store", type="float", metavar="FRACTION",
+                      help="allowed slowdown or memory growth")
+
+    (options, args) = parser.parse_args()
+
+    results = run(options)
+
+    if options.save:
+        with open(options.save, 'w') as out:
+            json.dump({'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'results': results}, out, indent=1, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare, 'r') as fh:
+            regressions = compare(results, json.load(fh), options.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Usage: bench_startup.py [options]
+
+Measures the cold start of the tagger in fresh interpreters: the import time
+of the package (python -X importtime -c "import tagger") and the time from
+the start of the import to the first tagged document. Exits with status 1
+if a budget is exceeded.
+'''
+
+import os
+import re
+import subprocess
+import sys
+from optparse import OptionParser
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+FIRST_TAG = '''
+import sys, time
+start = time.time()
+import tagger
+from tagger.weights import LazyWeights
+mytagger = tagger.Tagger(tagger.Reader(), tagger.Stemmer(),
+                         tagger.Rater(LazyWeights(%r)))
+with open(%r) as fh:
+    mytagger(fh.read())
+print(time.time() - start)
+'''
+
+
+def import_time(module):
+    '''
+    @param module: the name of the module to be imported
+
+    @returns: the cumulative import time of the module in seconds, and the
+              set of modules it imported
+    '''
+
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             'import ' + module],
+                            cwd=ROOT, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True).stderr
+
+    total = 0
+    modules = set()
+    for line in output.splitlines():
+        match = re.match(r'import time:\s*(\d+) \|\s*(\d+) \|(\s*)(\S+)', line)
+        if match:
+            modules.add(match.group(4))
+            if match.group(4) == module:
+                total = int(match.group(2))
+
+    return total / 1e6, modules
+
+
+def first_tag_time(dictionary, document):
+    '''
+    @returns: the time from importing the package to the first tagged
+              document, in seconds
+    '''
+
+    output = subprocess.run([sys.executable, '-c',
+                             FIRST_TAG % (dictionary, document)],
+                            cwd=ROOT, stdout=subprocess.PIPE,
+                            universal_newlines=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def best_of(repeat, function, *args):
+    return min(function(*args) for _ in range(repeat))
+
+
+if __name__ == '__main__':
+
+    parser = OptionParser(usage=__doc__.strip())
+    parser.add_option("", "--dict", dest="dictionary", default="data/dict.pkl",
+                      action="store", type="string", metavar="DICT",
+                      help="dictionary for weights (pickled or binary)")
+    parser.add_option("", "--doc", dest="document", default="tests/bbc1.txt",
+                      action="store", type="string", metavar="FILE",
+                      help="document to tag")
+    parser.add_option("", "--repeat", dest="repeat", default=5,
+                      action="store", type="int", metavar="N",
+                      help="runs of each measure (the best one is kept)")
+    parser.add_option("", "--import_budget", dest="import_budget",
+                      default=0.05, action="store", type="float",
+                      metavar="SECONDS", help="budget for 'import tagger'")
+    parser.add_option("", "--first_tag_budget", dest="first_tag_budget",
+                      default=2.0, action="store", type="float",
+                      metavar="SECONDS", help="budget for the first tags")
+
+    (options, args) = parser.parse_args()
+
+    failed = False
+
+    for module in ('tagger', 'tagger.extras'):
+        seconds = min(import_time(module)[0] for _ in range(options.repeat))
+        heavy = sorted(m for m in import_time(module)[1]
+                       if m.split('.')[0] in ('nltk', 'lxml', 'numpy'))
+        print('import %-15s %8.1f ms' % (module, seconds * 1000))
+        if heavy:
+            print('  imports heavy modules eagerly: %s' % ', '.join(heavy))
+            failed = True
+        if module == 'tagger' and seconds > options.import_budget:
+            print('  over budget (%.1f ms)' % (options.import_budget * 1000))
+            failed = True
+
+    seconds = best_of(options.repeat, first_tag_time,
+                      options.dictionary, options.document)
+    print('time to first tag     %8.1f ms' % (seconds * 1000))
+    if seconds > options.first_tag_budget:
+        print('  over budget (%.1f ms)' % (options.first_tag_budget * 1000))
+        failed = True
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,26 @@
+#!/bin/sh
+#
+# Usage: compare_reference.sh [REFERENCE] [bench_pipeline.py options]
+#
+# Runs benchmarks/bench_pipeline.py on a reference commit (HEAD^ by default:
+# the target branch when the CI builds the merge commit of a pull request,
+# the previous commit otherwise) and then on the working tree, on the same
+# machine and in the same job, and exits with status 1 if a stage got slower
+# or hungrier than the tolerance allows. Both runs read the documents and
+# the dictionary of the working tree, so only the code differs.
+
+set -e
+
+reference=${1:-HEAD^}
+[ $# -gt 0 ] && shift
+
+root=$(git rev-parse --show-toplevel)
+worktree=$(mktemp -d)
+results=$(mktemp)
+trap 'git -C "$root" worktree remove --force "$worktree"; rm -f "$results"' EXIT
+
+git -C "$root" worktree add --detach "$worktree" "$reference"
+
+cd "$root"
+python "$worktree/benchmarks/bench_pipeline.py" --save "$results" "$@"
+python benchmarks/bench_pipeline.py --compare "$results" "$@"
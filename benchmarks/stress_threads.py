@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Usage: stress_threads.py [options]
+
+Shares a single tagger (with small stem and result caches, so that they keep
+evicting, and an instrument) among many threads tagging the documents in
+tests/ and synthetic variations of them, and checks that every result is the
+same as in a serial run, and that the counters of the caches and of the
+instrument add up. Exits with status 1 on any mismatch.
+
+On a build of Python with the GIL this mostly checks correctness; on a
+free-threaded build it also shows how the throughput scales with the threads.
+'''
+
+import glob
+import os
+import random
+import sys
+import threading
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from tagger import Reader, Stemmer, Rater, Tagger, StemCache, ResultCache
+from tagger.instrument import Instrument, Aggregate
+from tagger.weights import LazyWeights
+
+
+def documents(count, seed=0):
+    '''
+    @param count: the number of documents to be returned
+
+    @returns: a list of documents made of shuffled paragraphs of the
+              documents in tests/ (the first ones are the originals)
+    '''
+
+    texts = []
+    for doc in sorted(glob.glob('tests/*.txt')):
+        with open(doc, 'r') as file:
+            texts.append(file.read())
+
+    rng = random.Random(seed)
+    paragraphs = [par for text in texts for par in text.split('\n')
+                  if par.strip()]
+    while len(texts) < count:
+        texts.append('\n'.join(rng.sample(paragraphs, 10)))
+
+    return texts[:count]
+
+
+def worker(tagger, texts, expected, rounds, seed, errors):
+    rng = random.Random(seed)
+    order = list(range(len(texts)))
+
+    for _ in range(rounds):
+        rng.shuffle(order)
+        for i in order:
+            tags = [t.string for t in tagger(texts[i], 5)]
+            if tags != expected[i]:
+                errors.append('document %d: %r instead of %r' % (
+                    i, tags, expected[i]))
+
+
+def run(options):
+    weights = LazyWeights(options.dictionary)
+    texts = documents(options.documents)
+
+    serial = Tagger(Reader(), Stemmer(), Rater(weights))
+    expected = [[t.string for t in serial(text, 5)] for text in texts]
+
+    stems = StemCache(maxsize=options.stem_cache)
+    results = ResultCache(maxsize=options.result_cache)
+    aggregate = Aggregate()
+    shared = Tagger(Reader(), Stemmer(cache=stems), Rater(weights),
+                    instrument=Instrument(aggregate), cache=results)
+
+    errors = []
+    threads = [threading.Thread(target=worker,
+                                args=(shared, texts, expected,
+                                      options.rounds, seed, errors))
+               for seed in range(options.threads)]
+
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    calls = options.threads * options.rounds * len(texts)
+    print('%d threads, %d documents tagged in %.2f s (%.0f docs/s)' % (
+        options.threads, calls, elapsed, calls / elapsed))
+
+    # the counters must add up, whatever the interleaving
+    result_stats = results.stats()
+    stem_stats = stems.stats()
+    tokens = aggregate.summary().get('tokens', {}).get('sum', 0)
+    if result_stats['hits'] + result_stats['misses'] != calls:
+        errors.append('result cache: %r for %d calls' % (result_stats, calls))
+    if aggregate.count != result_stats['misses']:
+        errors.append('instrument: %d records for %d cache misses' % (
+            aggregate.count, result_stats['misses']))
+    if stem_stats['hits'] + stem_stats['misses'] != tokens:
+        errors.append('stem cache: %r for %d tokens' % (stem_stats, tokens))
+    if len(stems) > options.stem_cache:
+        errors.append('stem cache: %d entries over the limit' % len(stems))
+    print('result cache: %r' % result_stats)
+    print('stem cache:   %r' % stem_stats)
+
+    # the batch mode on a pool of threads
+    start = time.time()
+    batch = [[t.string for t in tags]
+             for tags in shared.tag_many(texts, 5, workers=options.threads,
+                                         chunksize=4, threads=True)]
+    print('tag_many: %d documents in %.2f s' % (len(texts),
+                                                 time.time() - start))
+    for i, tags in enumerate(batch):
+        if tags != expected[i]:
+            errors.append('tag_many, document %d: %r instead of %r' % (
+                i, tags, expected[i]))
+
+    return errors
+
+
+if __name__ == '__main__':
+
+    parser = OptionParser(usage=__doc__.strip())
+    parser.add_option("", "--dict", dest="dictionary", default="data/dict.pkl",
+                      action="store", type="string", metavar="DICT",
+                      help="dictionary for weights (pickled or binary)")
+    parser.add_option("", "--threads", dest="threads", default=8,
+                      action="store", type="int", metavar="N",
+                      help="number of threads sharing the tagger")
+    parser.add_option("", "--documents", dest="documents", default=100,
+                      action="store", type="int", metavar="N",
+                      help="number of distinct documents")
+    parser.add_option("", "--rounds", dest="rounds", default=3,
+                      action="store", type="int", metavar="N",
+                      help="times each thread tags every document")
+    parser.add_option("", "--stem_cache", dest="stem_cache", default=500,
+                      action="store", type="int", metavar="N",
+                      help="size of the shared stem cache")
+    parser.add_option("", "--result_cache", dest="result_cache", default=20,
+                      action="store", type="int", metavar="N",
+                      help="size of the shared result cache")
+
+    (options, args) = parser.parse_args()
+
+    errors = run(options)
+    for error in errors[:20]:
+        print('MISMATCH ' + error)
+    sys.exit(1 if errors else 0)
@@ -18,4 +18,5 @@ setup(name='Tagger',
       package_dir={'tagger': 'tagger'},
       package_data={'tagger': ['data/*.pkl']},
       install_requires=['nltk'],
+      python_requires='>=3.4',
       provides=['tagger'])
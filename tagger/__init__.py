@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
-from .tagger import Tagger, Reader, Rater, Stemmer
-
-__all__ = ['Tagger', 'Reader', 'Rater', 'Stemmer']
+from .tagger import Tagger, Reader, Rater, Stemmer, Vocabulary
+from .cache import StemCache, ResultCache
 
+__all__ = ['Tagger', 'Reader', 'Rater', 'Stemmer', 'Vocabulary',
+           'StemCache', 'ResultCache']
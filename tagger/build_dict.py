@@ -0,0 +1,603 @@
+#!/usr/bin/env python
+
+'''
+Usage: python -m tagger.build_dict -o <output file> [-s <stopwords file>]
+                                   [-j <worker processes>] <list of files>
+'''
+
+
+
+import hashlib
+
+from .tagger import Stemmer
+from .extras import SimpleReader
+
+
+def count_terms(corpus, counts=None):
+    '''
+    @param corpus: an iterable of documents, represented as lists of
+                   (stemmed) words; it is consumed one document at a time
+    @param counts: partial counts to be updated (optional)
+
+    @returns: a tuple (document frequencies, collection frequencies, number
+              of documents, number of words)
+    '''
+
+    from collections import Counter
+
+    doc_freq, coll_freq, corpus_size, total_count = counts or (Counter(),
+                                                               Counter(), 0, 0)
+
+    for doc in corpus:
+        term_count = Counter(doc)
+        coll_freq.update(term_count)
+        doc_freq.update(term_count.keys())
+        corpus_size += 1
+        total_count += len(doc)
+
+    return doc_freq, coll_freq, corpus_size, total_count
+
+
+def merge_counts(counts, partial):
+    '''
+    @param counts:  counts as returned by L{count_terms}, updated in place
+    @param partial: counts to be added
+
+    @returns: the merged counts
+    '''
+
+    doc_freq, coll_freq, corpus_size, total_count = counts
+    doc_freq.update(partial[0])
+    coll_freq.update(partial[1])
+
+    return doc_freq, coll_freq, corpus_size + partial[2], total_count + partial[3]
+
+
+def build_dict_from_counts(counts, stopwords=None, measure='IDF'):
+    '''
+    @param counts:    counts as returned by L{count_terms}
+    @param stopwords: the list of (stemmed) words that should have zero weight
+    @param measure:   the measure used to compute the weights ('IDF'
+                      i.e. 'inverse document frequency' or 'ICF' i.e.
+                      'inverse collection frequency'; defaults to 'IDF')
+
+    @returns: a dictionary of weights in the interval [0,1]
+    '''
+
+    import math
+
+    doc_freq, coll_freq, corpus_size, total_count = counts
+
+    dictionary = {}
+
+    if measure == 'ICF':
+        scale = math.log(total_count)
+
+        for w, cnt in coll_freq.items():
+            dictionary[w] = math.log(total_count / (cnt + 1)) / scale
+
+    elif measure == 'IDF':
+        scale = math.log(corpus_size)
+
+        for w, cnt in doc_freq.items():
+            dictionary[w] = math.log(corpus_size / (cnt + 1)) / scale
+
+    if stopwords:
+        for w in stopwords:
+            dictionary[w] = 0.0
+
+    return dictionary
+
+
+def build_dict(corpus, stopwords=None, measure='IDF'):
+    '''
+    @param corpus:    an iterable of documents, represented as lists of
+                      (stemmed) words
+    @param stopwords: the list of (stemmed) words that should have zero weight
+    @param measure:   the measure used to compute the weights ('IDF'
+                      i.e. 'inverse document frequency' or 'ICF' i.e.
+                      'inverse collection frequency'; defaults to 'IDF')
+
+    @returns: a dictionary of weights in the interval [0,1]
+    '''
+
+    return build_dict_from_counts(count_terms(corpus), stopwords, measure)
+
+
+class DictionaryStats:
+    '''
+    Class for the raw corpus statistics a dictionary of weights is derived
+    from, so that documents can be added or removed without counting the
+    whole corpus again
+    '''
+
+    def __init__(self, measure='IDF', stopwords=None, path=None):
+        '''
+        @param measure:   the measure used to compute the weights ('IDF'
+                          i.e. 'inverse document frequency' or 'ICF' i.e.
+                          'inverse collection frequency'; defaults to 'IDF')
+        @param stopwords: the list of (stemmed) words that should have zero
+                          weight
+        @param path:      a file saved by L{DictionaryStats.save} to load the
+                          statistics from (optional)
+
+        @returns: a new L{DictionaryStats} object
+        '''
+
+        self.measure = measure
+        self.stopwords = set(stopwords or ())
+        self.counts = count_terms([])
+        # incremented whenever the counts are updated or loaded (the measure
+        # and the stopwords are not supposed to change after construction);
+        # the fingerprint, and the identity of the weights in the
+        # ResultCache, are only computed again when it changes
+        self.version = 0
+        # sum of the checksums of the counts of each word (see fingerprint)
+        self._checksum = 0
+        # the version and the fingerprint computed for it
+        self._fingerprint = (None, None)
+        self._cache = {}
+
+        if path:
+            self.load(path)
+
+    def add_documents(self, corpus):
+        '''
+        @param corpus: an iterable of documents, represented as lists of
+                       (stemmed) words
+        '''
+
+        self._update(count_terms(corpus), 1)
+
+    def remove_documents(self, corpus):
+        '''
+        @param corpus: an iterable of documents previously added, represented
+                       as lists of (stemmed) words
+        '''
+
+        removed = count_terms(corpus)
+        doc_freq, coll_freq = self.counts[:2]
+
+        for w, cnt in removed[1].items():
+            if coll_freq.get(w, 0) < cnt:
+                raise ValueError('%r was not added to the statistics' % w)
+
+        self._update(removed, -1)
+
+    def add_counts(self, counts):
+        '''
+        @param counts: counts as returned by L{count_terms} (for instance by
+                       L{count_files}) to be added
+        '''
+
+        self._update(counts, 1)
+
+    def _update(self, counts, sign):
+        doc_freq, coll_freq, corpus_size, total_count = self.counts
+        old_scale = self._scale_count()
+        words = set(counts[0]) | set(counts[1])
+        checksum = self._checksum - sum(map(self._term_checksum, words))
+
+        for freq, delta in ((doc_freq, counts[0]), (coll_freq, counts[1])):
+            for w, cnt in delta.items():
+                cnt = freq[w] + sign * cnt
+                if cnt > 0:
+                    freq[w] = cnt
+                else:
+                    del freq[w]
+
+        self.counts = (doc_freq, coll_freq, corpus_size + sign * counts[2],
+                       total_count + sign * counts[3])
+        self._checksum = ((checksum + sum(map(self._term_checksum, words))) %
+                          (1 << 64))
+        self.version += 1
+
+        # the weights only change for the terms whose counts changed, unless
+        # the size of the corpus changed too
+        if self._scale_count() != old_scale:
+            self._cache.clear()
+        else:
+            changed = counts[1] if self.measure == 'ICF' else counts[0]
+            for w in changed:
+                self._cache.pop(w, None)
+
+    def _scale_count(self):
+        return self.counts[3] if self.measure == 'ICF' else self.counts[2]
+
+    def _term_checksum(self, w):
+        doc_freq, coll_freq = self.counts[:2]
+        df = doc_freq.get(w, 0)
+        cf = coll_freq.get(w, 0)
+        if not df and not cf:
+            return 0
+        digest = hashlib.sha1(('%s\t%d\t%d' % (w, df, cf)).encode('utf-8'))
+        return int.from_bytes(digest.digest()[:8], 'little')
+
+    @property
+    def fingerprint(self):
+        '''
+        A digest of the statistics, the measure and the stopwords: it is the
+        same in every process for the same statistics, whatever the order in
+        which the documents were added or removed
+        '''
+
+        version, fingerprint = self._fingerprint
+        if version == self.version:
+            return fingerprint
+
+        version = self.version
+        doc_freq, coll_freq, corpus_size, total_count = self.counts
+        sha = hashlib.sha1(('%s\t%d\t%d\t%d\n' % (
+            self.measure, corpus_size, total_count,
+            self._checksum)).encode('utf-8'))
+        for w in sorted(self.stopwords):
+            sha.update(('%s\n' % w).encode('utf-8'))
+
+        fingerprint = sha.hexdigest()
+        # a single assignment, so that threads never see a fingerprint paired
+        # with another version
+        self._fingerprint = (version, fingerprint)
+
+        return fingerprint
+
+    def weight(self, w, default=None):
+        '''
+        @param w:       a (stemmed) word
+        @param default: value returned if the word is not in the corpus
+
+        @returns: the weight of the word, with the same formulas as
+                  L{build_dict}
+        '''
+
+        if w in self.stopwords:
+            return 0.0
+
+        try:
+            return self._cache[w]
+        except KeyError:
+            pass
+
+        import math
+
+        freq = self.counts[1] if self.measure == 'ICF' else self.counts[0]
+        cnt = freq.get(w)
+        if cnt is None:
+            return default
+
+        total = self._scale_count()
+        weight = math.log(total / (cnt + 1)) / math.log(total)
+        self._cache[w] = weight
+
+        return weight
+
+    def weights(self):
+        '''
+        @returns: a read-only, live view of the weights that can be passed to
+                  a L{Rater} (it follows the additions and removals without
+                  being rebuilt)
+        '''
+
+        return StatsWeights(self)
+
+    def to_dict(self):
+        '''
+        @returns: a dictionary of weights, as returned by L{build_dict}
+        '''
+
+        return build_dict_from_counts(self.counts, self.stopwords, self.measure)
+
+    def save(self, path):
+        '''
+        @param path: the name of the file where the statistics should be saved
+        '''
+
+        import pickle
+
+        with open(path, 'wb') as out:
+            pickle.dump((self.measure, self.stopwords, self.counts), out,
+                        protocol=2)
+
+    def load(self, path):
+        '''
+        @param path: a file saved by L{DictionaryStats.save}
+        '''
+
+        import pickle
+
+        with open(path, 'rb') as fh:
+            self.measure, self.stopwords, self.counts = pickle.load(fh)
+        doc_freq, coll_freq = self.counts[:2]
+        self._checksum = sum(map(self._term_checksum,
+                                 set(doc_freq) | set(coll_freq))) % (1 << 64)
+        self.version += 1
+        self._cache.clear()
+
+
+class StatsWeights:
+    '''
+    Read-only dictionary of weights derived on demand from a
+    L{DictionaryStats} object
+    '''
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    @property
+    def fingerprint(self):
+        return self.stats.fingerprint
+
+    @property
+    def version(self):
+        # the weights change with the statistics (see cache.identity)
+        return self.stats.version
+
+    def _words(self):
+        stats = self.stats
+        freq = stats.counts[1] if stats.measure == 'ICF' else stats.counts[0]
+        return freq.keys() | stats.stopwords
+
+    def __len__(self):
+        return len(self._words())
+
+    def __contains__(self, w):
+        return self.stats.weight(w) is not None
+
+    def __iter__(self):
+        return iter(self._words())
+
+    def __getitem__(self, w):
+        weight = self.stats.weight(w)
+        if weight is None:
+            raise KeyError(w)
+        return weight
+
+    def get(self, w, default=None):
+        return self.stats.weight(w, default)
+
+    def keys(self):
+        return self._words()
+
+    def items(self):
+        return ((w, self.stats.weight(w)) for w in self._words())
+
+
+class BlendedWeights:
+    '''
+    Read-only dictionary of weights mixing a static dictionary with the
+    weights of another corpus (for instance the live view of the statistics
+    of the collection being tagged, see L{DictionaryStats.weights})
+    '''
+
+    def __init__(self, base, corpus, alpha=0.5):
+        '''
+        @param base:   a dictionary of weights normalized in the interval
+                       [0,1]
+        @param corpus: another dictionary of weights, e.g. returned by
+                       L{DictionaryStats.weights}
+        @param alpha:  the exponent of the corpus weights in the blend (a
+                       weighted geometric mean), in the interval [0,1]
+
+        @returns: a new L{BlendedWeights} object
+        '''
+
+        self.base = base
+        self.corpus = corpus
+        self.alpha = alpha
+
+    @property
+    def fingerprint(self):
+        # the identities of both sides, as used by the ResultCache (they are
+        # memoized, so this is cheap)
+        from .cache import identity
+
+        return hashlib.sha1(('%s\n%s\n%r' % (
+            identity(self.base), identity(self.corpus),
+            self.alpha)).encode('utf-8')).hexdigest()
+
+    @property
+    def version(self):
+        # the blend changes when either side does (see cache.identity)
+        return (getattr(self.base, 'version', None),
+                getattr(self.corpus, 'version', None), self.alpha)
+
+    def _words(self):
+        return set(self.base.keys()) | set(self.corpus.keys())
+
+    def __len__(self):
+        return len(self._words())
+
+    def __contains__(self, w):
+        return w in self.base or w in self.corpus
+
+    def __iter__(self):
+        return iter(self._words())
+
+    def __getitem__(self, w):
+        weight = self.get(w)
+        if weight is None:
+            raise KeyError(w)
+        return weight
+
+    def get(self, w, default=None):
+        base = self.base.get(w)
+        corpus = self.corpus.get(w)
+        if base is None and corpus is None:
+            return default
+
+        # the words missing from one side get the rating of unknown words;
+        # the words found in every document of a small corpus get negative
+        # weights from the formulas of build_dict
+        base = 1.0 if base is None else min(max(base, 0.0), 1.0)
+        corpus = 1.0 if corpus is None else min(max(corpus, 0.0), 1.0)
+
+        # weighted geometric mean, so that the stopwords of either side keep
+        # a zero weight
+        return base ** (1 - self.alpha) * corpus ** self.alpha
+
+    def keys(self):
+        return self._words()
+
+    def items(self):
+        return ((w, self.get(w)) for w in self._words())
+
+
+# the reader and stemmer owned by each worker process (see _init_worker)
+_reader = None
+_stemmer = None
+
+
+def _init_worker(reader, stemmer):
+    global _reader, _stemmer
+    _reader = reader
+    _stemmer = stemmer
+
+
+def _read_files(filenames):
+    for filename in filenames:
+        with open(filename, 'r') as doc:
+            yield [w.stem for w in map(_stemmer, _reader(doc.read()))]
+
+
+def _read_texts(texts):
+    for text in texts:
+        yield [w.stem for w in map(_stemmer, _reader(text))]
+
+
+def _count_files(filenames):
+    return [count_terms(_read_files(filenames))]
+
+
+def _count_texts(texts):
+    return [count_terms(_read_texts(texts))]
+
+
+def count_files(corpus_files, reader=None, stemmer=None, workers=1,
+                chunksize=64):
+    '''
+    @param corpus_files: an iterable of files with words to process (one
+                         document per file)
+    @param reader:       the L{Reader} object to be used (defaults to
+                         L{SimpleReader})
+    @param stemmer:      the L{Stemmer} object to be used (defaults to
+                         L{Stemmer})
+    @param workers:      number of worker processes (None for the number of
+                         CPUs)
+    @param chunksize:    number of files counted by a worker at once
+
+    @returns: counts as returned by L{count_terms}
+    '''
+
+    reader = reader or SimpleReader()
+    stemmer = stemmer or Stemmer()
+
+    if workers == 1:
+        _init_worker(reader, stemmer)
+        return count_terms(_read_files(corpus_files))
+
+    from . import parallel
+
+    # each worker counts a chunk of files at a time, and only the partial
+    # counts (bounded by the vocabulary) travel back to be merged
+    counts = count_terms([])
+    for partial in parallel.imap(_count_files, corpus_files, workers=workers,
+                                 chunksize=chunksize, ordered=False,
+                                 initializer=_init_worker,
+                                 initargs=(reader, stemmer)):
+        counts = merge_counts(counts, partial)
+
+    return counts
+
+
+def count_texts(texts, reader=None, stemmer=None, workers=1, chunksize=64):
+    '''
+    @param texts:     an iterable of strings of text (one document each); it
+                      is consumed lazily
+    @param reader:    the L{Reader} object to be used (defaults to
+                      L{SimpleReader})
+    @param stemmer:   the L{Stemmer} object to be used (defaults to
+                      L{Stemmer})
+    @param workers:   number of worker processes (None for the number of
+                      CPUs)
+    @param chunksize: number of texts counted by a worker at once
+
+    @returns: counts as returned by L{count_terms}
+    '''
+
+    reader = reader or SimpleReader()
+    stemmer = stemmer or Stemmer()
+
+    if workers == 1:
+        _init_worker(reader, stemmer)
+        return count_terms(_read_texts(texts))
+
+    from . import parallel
+
+    counts = count_terms([])
+    for partial in parallel.imap(_count_texts, texts, workers=workers,
+                                 chunksize=chunksize, ordered=False,
+                                 initializer=_init_worker,
+                                 initargs=(reader, stemmer)):
+        counts = merge_counts(counts, partial)
+
+    return counts
+
+
+def build_dict_from_files(output_file, corpus_files, stopwords_file=None,
+                          reader=None, stemmer=None, measure='IDF',
+                          verbose=False, workers=1):
+    '''
+    @param output_file:    the name of the file where the dictionary should be
+                           saved
+    @param corpus_files:   an iterable of files with words to process
+    @param stopwords_file: a file containing a list of stopwords
+    @param reader:         the L{Reader} object to be used (defaults to
+                           L{SimpleReader})
+    @param stemmer:        the L{Stemmer} object to be used (defaults to
+                           L{Stemmer})
+    @param measure:        the measure used to compute the weights ('IDF'
+                           i.e. 'inverse document frequency' or 'ICF' i.e.
+                           'inverse collection frequency'; defaults to 'IDF')
+    @param verbose:        whether information on the progress should be
+                           printed on screen
+    @param workers:        number of worker processes counting the corpus
+                           (None for the number of CPUs)
+    '''
+
+    import pickle
+
+    reader = reader or SimpleReader()
+    stemmer = stemmer or Stemmer()
+
+    if verbose: print('Processing corpus...')
+    counts = count_files(corpus_files, reader, stemmer, workers)
+
+    stopwords = None
+    if stopwords_file:
+        if verbose: print('Processing stopwords...')
+        with open(stopwords_file, 'r') as sw:
+            stopwords = reader(sw.read())
+        stopwords = [w.stem for w in map(stemmer, stopwords)]
+
+    if verbose: print('Building dictionary... ')
+    dictionary = build_dict_from_counts(counts, stopwords, measure)
+    with open(output_file, 'wb') as out:
+        pickle.dump(dictionary, out, protocol=2)
+
+
+if __name__ == '__main__':
+
+    import getopt
+    import sys
+
+    try:
+        opts, corpus = getopt.getopt(sys.argv[1:], 'o:s:j:')
+        opts = dict(opts)
+        output_file = opts['-o']
+        stopwords_file = opts.get('-s')
+        workers = int(opts.get('-j', 1)) or None
+    except:
+        print(__doc__)
+        exit(1)
+
+    build_dict_from_files(output_file, corpus, stopwords_file, verbose=True,
+                          workers=workers)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Usage: python -m tagger.bulk [options] [directory]
+
+Tags a stream of documents, writing one JSON object per line on the standard
+output, {"id": ..., "tags": [...]}, in the same order as the input
+
+The documents are read from the standard input as JSON lines, {"id": ...,
+"text": ...} (the id defaults to the line number), or from the files under the
+given directory (the id being the path of each file relative to it).
+Progress is reported on the standard error.
+'''
+
+import collections
+import fnmatch
+import io
+import json
+import os
+import sys
+import time
+
+from .tagger import Tagger, Reader, Stemmer, Rater
+
+
+def read_jsonl(stream, id_field='id', text_field='text', errors=None):
+    '''
+    @param stream:     a binary or text stream of JSON lines
+    @param id_field:   the field holding the id of a document
+    @param text_field: the field holding the text of a document
+    @param errors:     a stream where invalid lines are reported (they are
+                       skipped silently if None); a line is invalid if it is
+                       not a JSON object, or if its text is not a string
+
+    @returns: an iterator over (id, text) pairs
+    '''
+
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            document = json.loads(line)
+            text = document[text_field]
+            if not isinstance(text, str):
+                raise TypeError('%r is not a string' % text_field)
+        except (ValueError, KeyError, AttributeError, TypeError) as e:
+            if errors is not None:
+                errors.write('line %d skipped: %r\n' % (number, e))
+            continue
+        yield document.get(id_field, number), text
+
+
+def read_tree(directory, pattern='*'):
+    '''
+    @param directory: the root of a directory tree
+    @param pattern:   a shell pattern the names of the files must match
+
+    @returns: an iterator over (relative path, text) pairs, in sorted order
+    '''
+
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(fnmatch.filter(files, pattern)):
+            path = os.path.join(root, name)
+            with open(path, 'r', errors='replace') as doc:
+                yield os.path.relpath(path, directory), doc.read()
+
+
+def tag_stream(tagger, documents, out, tags_number=5, jobs=1, chunksize=16,
+               progress=None, every=5.0):
+    '''
+    @param tagger:      the L{Tagger} object to be used
+    @param documents:   an iterable of (id, text) pairs
+    @param out:         a text stream where the JSON lines are written
+    @param tags_number: number of best tags to be returned for each text
+    @param jobs:        number of worker processes (None for the number of
+                        CPUs)
+    @param chunksize:   number of documents sent to a worker at once
+    @param progress:    a stream where the progress is reported (optional)
+    @param every:       seconds between two progress reports
+
+    @returns: the number of documents tagged
+    '''
+
+    # the ids wait here while their texts are being tagged, and the results
+    # come back in the same order
+    ids = collections.deque()
+
+    def texts():
+        for doc_id, text in documents:
+            ids.append(doc_id)
+            yield text
+
+    start = last = time.time()
+    count = 0
+
+    for tags in tagger.tag_many(texts(), tags_number, workers=jobs,
+                                chunksize=chunksize):
+        out.write(json.dumps({'id': ids.popleft(),
+                              'tags': [t.string for t in tags]}))
+        out.write('\n')
+        count += 1
+
+        if progress is not None and time.time() - last >= every:
+            last = time.time()
+            progress.write('%d documents, %.1f docs/s\n' % (
+                count, count / (last - start)))
+            progress.flush()
+
+    if progress is not None:
+        elapsed = time.time() - start
+        progress.write('%d documents in %.1f s, %.1f docs/s\n' % (
+            count, elapsed, count / elapsed if elapsed else 0.0))
+        progress.flush()
+
+    return count
+
+
+if __name__ == '__main__':
+
+    from optparse import OptionParser
+    from .weights import LazyWeights
+
+    parser = OptionParser(usage=__doc__.strip())
+    parser.add_option("", "--dict", dest="dictionary", default="data/dict.pkl",
+                      action="store", type="string", metavar="DICT",
+                      help="dictionary for weights (pickled or binary)")
+    parser.add_option("", "--multitag_size", dest="multitag_size", default=3,
+                      action="store", type="int", metavar="TAG_SIZE",
+                      help="max words per tag")
+    parser.add_option("", "--tags_number", dest="tags_number", default=5,
+                      action="store", type="int", metavar="TAGS_NUMBER",
+                      help="number of tags to return per document")
+    parser.add_option("-j", "--jobs", dest="jobs", default=1,
+                      action="store", type="int", metavar="N",
+                      help="worker processes (0 for the number of CPUs)")
+    parser.add_option("", "--chunksize", dest="chunksize", default=16,
+                      action="store", type="int", metavar="N",
+                      help="documents sent to a worker at once")
+    parser.add_option("", "--pattern", dest="pattern", default="*",
+                      action="store", type="string", metavar="PATTERN",
+                      help="pattern of the files read from a directory")
+    parser.add_option("", "--id_field", dest="id_field", default="id",
+                      action="store", type="string", metavar="FIELD",
+                      help="field of the input holding the id")
+    parser.add_option("", "--text_field", dest="text_field", default="text",
+                      action="store", type="string", metavar="FIELD",
+                      help="field of the input holding the text")
+    parser.add_option("-q", "--quiet", dest="quiet", default=False,
+                      action="store_true",
+                      help="don't report the progress")
+
+    (options, args) = parser.parse_args()
+
+    if len(args) > 1:
+        parser.print_usage()
+        exit(1)
+
+    if args:
+        documents = read_tree(args[0], options.pattern)
+    else:
+        stdin = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8',
+                                 errors='replace')
+        documents = read_jsonl(stdin, options.id_field, options.text_field,
+                               sys.stderr)
+
+    # the workers load the dictionary by themselves (and share its pages if
+    # it is in the binary format)
+    tagger = Tagger(Reader(), Stemmer(),
+                    Rater(LazyWeights(options.dictionary),
+                          multitag_size=options.multitag_size))
+
+    # large buffered writes, instead of a system call per line
+    out = io.TextIOWrapper(io.BufferedWriter(sys.stdout.buffer, 1 << 20),
+                           encoding='utf-8', write_through=False)
+
+    try:
+        tag_stream(tagger, documents, out, options.tags_number,
+                   options.jobs or None, options.chunksize,
+                   None if options.quiet else sys.stderr)
+    finally:
+        out.flush()
@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+
+'''
+Caches for the expensive stages of the tagging pipeline
+'''
+
+import collections
+import hashlib
+import marshal
+import os
+import threading
+import time
+
+
+class StemCache:
+    '''
+    Bounded mapping from (preprocessed) strings to their stems, with LRU
+    eviction
+
+    (a single cache can be shared by many L{Stemmer} objects, and thus by many
+    L{Tagger} objects, as long as they all stem the same language; it can be
+    used by many threads at once)
+    '''
+
+    def __init__(self, maxsize=100000, path=None):
+        '''
+        @param maxsize: maximum number of stems kept in memory
+        @param path:    a file saved by L{StemCache.save} to warm-start the
+                        cache from (optional)
+
+        @returns: a new L{StemCache} object
+        '''
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._stems = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        if path:
+            self.load(path)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._stems)
+
+    def __contains__(self, string):
+        return string in self._stems
+
+    def stem(self, string, function):
+        '''
+        @param string:   the (preprocessed) string to be stemmed
+        @param function: the function computing the stem on a cache miss
+
+        @returns: the stem of the string
+        '''
+
+        stems = self._stems
+
+        with self._lock:
+            try:
+                stem = stems[string]
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                stems.move_to_end(string)
+                return stem
+
+        # the stem is computed outside of the lock, so other threads aren't
+        # held up (two threads may compute the same stem)
+        stem = function(string)
+
+        with self._lock:
+            stems[string] = stem
+            stems.move_to_end(string)
+            if len(stems) > self.maxsize:
+                stems.popitem(last=False)
+                self.evictions += 1
+
+        return stem
+
+    def stats(self):
+        '''
+        @returns: a dictionary with the number of hits, misses and evictions
+                  so far, and the current size of the cache
+        '''
+
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': len(self._stems)}
+
+    def clear(self):
+        with self._lock:
+            self._stems.clear()
+
+    def load(self, path):
+        '''
+        @param path: a file saved by L{StemCache.save}; its most recently
+                     used entries are added to the cache, up to its maximum
+                     size
+        '''
+
+        import pickle
+
+        with open(path, 'rb') as fh:
+            table = pickle.load(fh)
+
+        items = list(table.items())[-self.maxsize:]
+        stems = self._stems
+        with self._lock:
+            stems.update(items)
+            while len(stems) > self.maxsize:
+                stems.popitem(last=False)
+
+    def save(self, path):
+        '''
+        @param path: the name of the file where the cache should be saved
+        '''
+
+        with self._lock:
+            table = dict(self._stems)
+
+        import pickle
+
+        with open(path, 'wb') as out:
+            pickle.dump(table, out, protocol=2)
+
+
+# identities of the last weights seen, by id(): each entry keeps a
+# reference to the weights, so that their id can't be reused while the entry
+# is in the table (see identity)
+_identities = collections.OrderedDict()
+_identities_lock = threading.Lock()
+# maximum number of weights whose identity is remembered
+identities_size = 64
+
+
+def identity(weights):
+    '''
+    @param weights: a dictionary of weights
+
+    @returns: a string that changes whenever the weights do, and is the same
+              in every process for the same weights (so that it can key the
+              results shared on disk): it is the fingerprint of the weights
+              that have one (e.g. L{DictionaryStats.weights}), it depends on
+              the path, size and modification time of the file for the
+              weights loaded from disk, and on a digest of the items for the
+              other dictionaries
+
+    (it is computed once per weights object: the weights that change in
+    place must either have a C{version} attribute that changes with them, as
+    the live views of L{DictionaryStats} do, or be passed to L{invalidate}
+    after each change)
+    '''
+
+    key = id(weights)
+    version = getattr(weights, 'version', None)
+
+    with _identities_lock:
+        entry = _identities.get(key)
+        if (entry is not None and entry[0] is weights and
+                entry[1] == version):
+            _identities.move_to_end(key)
+            return entry[2]
+
+    value = _identity(weights)
+
+    with _identities_lock:
+        _identities[key] = (weights, version, value)
+        _identities.move_to_end(key)
+        while len(_identities) > identities_size:
+            _identities.popitem(last=False)
+
+    return value
+
+
+def invalidate(weights=None):
+    '''
+    Forgets the identity of the weights, which is computed again at the next
+    call of L{identity} (to be called after changing a dictionary of weights
+    in place)
+
+    @param weights: a dictionary of weights (if not given, the identities of
+                    all the weights are forgotten)
+    '''
+
+    with _identities_lock:
+        if weights is None:
+            _identities.clear()
+        else:
+            entry = _identities.get(id(weights))
+            if entry is not None and entry[0] is weights:
+                del _identities[id(weights)]
+
+
+def _identity(weights):
+    fingerprint = getattr(weights, 'fingerprint', None)
+    if fingerprint is not None:
+        return 'fingerprint:' + fingerprint
+
+    path = getattr(weights, 'path', None)
+    if path is not None:
+        stat = os.stat(path)
+        return 'file:%s:%d:%d' % (os.path.abspath(path), stat.st_size,
+                                  stat.st_mtime_ns)
+
+    if type(weights) is dict:
+        # serializing a plain dictionary of strings and floats is much
+        # faster than sorting it (version 2 of the format doesn't depend on
+        # the reference counts of the objects)
+        try:
+            data = marshal.dumps(weights, 2)
+        except ValueError:
+            data = None
+        if data is not None:
+            return 'marshal:' + hashlib.sha1(data).hexdigest()
+
+    sha = hashlib.sha1()
+    for stem, weight in sorted(weights.items()):
+        sha.update(('%s\t%r\n' % (stem, weight)).encode('utf-8'))
+
+    return 'items:' + sha.hexdigest()
+
+
+class ResultCache:
+    '''
+    Cache of the tags of whole documents, keyed by a hash of the text and of
+    the configuration of the tagger (including the identity of its
+    dictionary, so the entries computed with different weights are never
+    returned)
+
+    (it has a bounded in-memory LRU tier, and optionally a persistent tier in
+    a SQLite database; both evict the entries older than the TTL; it can be
+    used by many threads at once)
+    '''
+
+    def __init__(self, maxsize=10000, path=None, max_disk_entries=1000000,
+                 ttl=None):
+        '''
+        @param maxsize:          maximum number of results kept in memory
+        @param path:             the name of a SQLite database where the
+                                 results are also stored (optional)
+        @param max_disk_entries: maximum number of results kept on disk
+        @param ttl:              number of seconds after which a result
+                                 expires (None for never)
+
+        @returns: a new L{ResultCache} object
+        '''
+
+        self.maxsize = maxsize
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._results = collections.OrderedDict()
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        self.db = None
+        if path:
+            import sqlite3
+            # autocommit, and write-ahead logging so that many processes can
+            # share the database (a miss costs much more than a write)
+            self.db = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                      check_same_thread=False)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            self.db.execute('CREATE TABLE IF NOT EXISTS results ('
+                            'key TEXT PRIMARY KEY, value BLOB, '
+                            'created REAL, accessed REAL)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS results_accessed '
+                            'ON results (accessed)')
+
+    def __reduce__(self):
+        # each process gets an empty memory tier, sharing the disk tier
+        return (ResultCache, (self.maxsize, self.path, self.max_disk_entries,
+                              self.ttl))
+
+    def __len__(self):
+        return len(self._results)
+
+    def identity(self, weights):
+        '''
+        @param weights: a dictionary of weights
+
+        @returns: a string that changes whenever the weights do (see
+                  L{identity})
+        '''
+
+        return identity(weights)
+
+    def invalidate(self, weights=None):
+        '''
+        Forgets the identity of the weights, after they were changed in place
+        (see L{invalidate})
+
+        @param weights: a dictionary of weights (if not given, the identities
+                        of all the weights are forgotten)
+        '''
+
+        invalidate(weights)
+
+    def key(self, tagger, text, tags_number):
+        '''
+        @param tagger:      a L{Tagger} object
+        @param text:        the string of text to be tagged
+        @param tags_number: number of best tags to be returned
+
+        @returns: the key of the result of the tagger on the text
+        '''
+
+        rater = tagger.rater
+        weights = getattr(rater, 'weights', None)
+        # results computed with other weights are never hit again (and
+        # leave the cache in due course)
+        identity = None if weights is None else self.identity(weights)
+
+        configuration = '%s|%s|%s|%s|%s|%s|%d' % (
+            type(tagger.reader).__name__, type(tagger.stemmer).__name__,
+            getattr(tagger.stemmer, 'language', None), type(rater).__name__,
+            getattr(rater, 'multitag_size', None), identity, tags_number)
+
+        # line endings and surrounding whitespace don't change the tags
+        text = text.strip().replace('\r\n', '\n')
+
+        sha = hashlib.sha1(configuration.encode('utf-8'))
+        sha.update(b'\0')
+        sha.update(text.encode('utf-8', 'surrogatepass'))
+
+        return sha.hexdigest()
+
+    def get(self, key):
+        '''
+        @param key: a key returned by L{ResultCache.key}
+
+        @returns: the cached list of tags, or None
+        '''
+
+        now = time.time()
+        results = self._results
+
+        with self._lock:
+            value = None
+            entry = results.get(key)
+            if entry is not None:
+                created, value = entry
+                if self.ttl is None or now - created < self.ttl:
+                    self.memory_hits += 1
+                    results.move_to_end(key)
+                else:
+                    del results[key]
+                    value = None
+
+            if value is None and self.db is not None:
+                row = self.db.execute('SELECT value, created FROM results '
+                                      'WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    value, created = row
+                    if self.ttl is None or now - created < self.ttl:
+                        self.disk_hits += 1
+                        self.db.execute('UPDATE results SET accessed = ? '
+                                        'WHERE key = ?', (now, key))
+                        self._remember(key, created, value)
+                    else:
+                        self.db.execute('DELETE FROM results WHERE key = ?',
+                                        (key,))
+                        value = None
+
+            if value is None:
+                self.misses += 1
+                return None
+
+        import pickle
+
+        return pickle.loads(value)
+
+    def put(self, key, tags):
+        '''
+        @param key:  a key returned by L{ResultCache.key}
+        @param tags: the list of tags to be cached
+        '''
+
+        import pickle
+
+        now = time.time()
+        value = pickle.dumps(tags, protocol=pickle.HIGHEST_PROTOCOL)
+
+        with self._lock:
+            self._remember(key, now, value)
+
+            if self.db is not None:
+                self.db.execute('INSERT OR REPLACE INTO results '
+                                'VALUES (?, ?, ?, ?)', (key, value, now, now))
+                self._puts += 1
+                # the disk tier is trimmed every so often
+                if self._puts % 1000 == 0:
+                    self._trim()
+
+    def _remember(self, key, created, value):
+        results = self._results
+        results[key] = (created, value)
+        results.move_to_end(key)
+        if len(results) > self.maxsize:
+            results.popitem(last=False)
+
+    def trim(self):
+        '''
+        Deletes the expired results, and the least recently used ones over
+        the size limit, from the disk tier
+        '''
+
+        with self._lock:
+            self._trim()
+
+    def _trim(self):
+        if self.db is None:
+            return
+
+        if self.ttl is not None:
+            self.db.execute('DELETE FROM results WHERE created < ?',
+                            (time.time() - self.ttl,))
+        self.db.execute('DELETE FROM results WHERE key IN ('
+                        'SELECT key FROM results ORDER BY accessed DESC '
+                        'LIMIT -1 OFFSET ?)', (self.max_disk_entries,))
+
+    def stats(self):
+        '''
+        @returns: a dictionary with the number of hits (in memory and on
+                  disk), misses and the hit rate so far, and the current size
+                  of the memory tier
+        '''
+
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+
+            return {'hits': hits, 'memory_hits': self.memory_hits,
+                    'disk_hits': self.disk_hits, 'misses': self.misses,
+                    'hit_rate': hits / float(lookups) if lookups else 0.0,
+                    'size': len(self._results)}
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            if self.db is not None:
+                self.db.execute('DELETE FROM results')
+
+    def close(self):
+        with self._lock:
+            if self.db is not None:
+                self._trim()
+                self.db.close()
+                self.db = None
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Usage: python -m tagger.corpus [options] <directory or JSON lines file>
+
+Tags a collection of documents against its own statistics: a first pass
+counts the document (or collection) frequencies of the stems in the whole
+collection, and a second pass tags each document with the weights of the
+dictionary blended with those of the collection, so that the terms that are
+common on the day are not mistaken for relevant ones. The tags are written
+on the standard output as JSON lines, like L{tagger.bulk} does.
+
+The statistics of the first pass can be saved and reused by later runs
+(--stats); only the vocabulary is kept in memory, never the documents.
+'''
+
+import copy
+import io
+import os
+import sys
+
+from .build_dict import DictionaryStats, BlendedWeights, count_texts
+from .bulk import read_jsonl, read_tree, tag_stream
+
+
+def read_collection(path, pattern='*', id_field='id', text_field='text',
+                    errors=None):
+    '''
+    @param path:       a directory, or a file of JSON lines
+    @param pattern:    a shell pattern the names of the files must match (if
+                       path is a directory)
+    @param id_field:   the field holding the id of a document (if path is a
+                       file)
+    @param text_field: the field holding the text of a document (if path is
+                       a file)
+    @param errors:     a stream where invalid lines are reported
+
+    @returns: an iterator over (id, text) pairs
+    '''
+
+    if os.path.isdir(path):
+        for document in read_tree(path, pattern):
+            yield document
+    else:
+        with io.open(path, 'r', encoding='utf-8', errors='replace') as stream:
+            for document in read_jsonl(stream, id_field, text_field, errors):
+                yield document
+
+
+def corpus_stats(texts, tagger, measure='IDF', stopwords=None, workers=1,
+                 chunksize=64, stats=None):
+    '''
+    First pass: counts the stems of a collection
+
+    @param texts:     an iterable of strings of text
+    @param tagger:    the L{Tagger} whose reader and stemmer split the texts
+                      (so that the stems match those it rates)
+    @param measure:   the measure used to compute the weights ('IDF' or
+                      'ICF', as in L{build_dict})
+    @param stopwords: the list of (stemmed) words that should have zero weight
+    @param workers:   number of worker processes (None for the number of
+                      CPUs)
+    @param chunksize: number of texts counted by a worker at once
+    @param stats:     a L{DictionaryStats} object the counts are added to
+                      (optional)
+
+    @returns: a L{DictionaryStats} object
+    '''
+
+    if stats is None:
+        stats = DictionaryStats(measure, stopwords)
+    stats.add_counts(count_texts(texts, tagger.reader, tagger.stemmer,
+                                 workers, chunksize))
+
+    return stats
+
+
+def blend(tagger, stats, alpha=0.5):
+    '''
+    @param tagger: a L{Tagger} object
+    @param stats:  the L{DictionaryStats} of the collection
+    @param alpha:  the exponent of the collection in the weights, in the
+                   interval [0,1]
+
+    @returns: a copy of the tagger rating with the blended weights (or the
+              tagger itself, if the collection has less than two documents
+              and thus no meaningful statistics)
+    '''
+
+    if stats.counts[2] < 2:
+        return tagger
+
+    rater = copy.copy(tagger.rater)
+    rater.weights = BlendedWeights(tagger.rater.weights, stats.weights(),
+                                   alpha)
+
+    tagger = copy.copy(tagger)
+    tagger.rater = rater
+
+    return tagger
+
+
+def tag_corpus(documents, tagger, out, alpha=0.5, measure='IDF',
+               stopwords=None, stats=None, tags_number=5, jobs=1,
+               chunksize=16, progress=None):
+    '''
+    @param documents:   a function returning a new iterator over the (id,
+                        text) pairs of the collection (it is called once per
+                        pass)
+    @param tagger:      the L{Tagger} object to be used
+    @param out:         a text stream where the JSON lines are written
+    @param alpha:       the exponent of the collection in the weights
+    @param measure:     the measure used to compute the weights of the
+                        collection ('IDF' or 'ICF')
+    @param stopwords:   the list of (stemmed) words that should have zero
+                        weight
+    @param stats:       the L{DictionaryStats} of the collection, if already
+                        counted (the first pass is skipped)
+    @param tags_number: number of best tags to be returned for each text
+    @param jobs:        number of worker processes (None for the number of
+                        CPUs)
+    @param chunksize:   number of documents sent to a worker at once (in
+                        both passes)
+    @param progress:    a stream where the progress is reported (optional)
+
+    @returns: the L{DictionaryStats} of the collection
+    '''
+
+    if stats is None:
+        if progress is not None:
+            progress.write('counting the collection...\n')
+        stats = corpus_stats((text for doc_id, text in documents()), tagger,
+                             measure, stopwords, jobs, chunksize)
+
+    tag_stream(blend(tagger, stats, alpha), documents(), out, tags_number,
+               jobs, chunksize, progress)
+
+    return stats
+
+
+if __name__ == '__main__':
+
+    from optparse import OptionParser
+    from .tagger import Tagger, Reader, Stemmer, Rater
+    from .weights import LazyWeights
+
+    parser = OptionParser(usage=__doc__.strip())
+    parser.add_option("", "--dict", dest="dictionary", default="data/dict.pkl",
+                      action="store", type="string", metavar="DICT",
+                      help="dictionary for weights (pickled or binary)")
+    parser.add_option("", "--stats", dest="stats", default=None,
+                      action="store", type="string", metavar="FILE",
+                      help="statistics of the collection (loaded if the "
+                           "file exists, otherwise counted and saved)")
+    parser.add_option("", "--alpha", dest="alpha", default=0.5,
+                      action="store", type="float", metavar="ALPHA",
+                      help="exponent of the collection in the weights")
+    parser.add_option("", "--measure", dest="measure", default=None,
+                      action="store", type="choice", choices=["IDF", "ICF"],
+                      help="weights of the collection (IDF or ICF; defaults "
+                           "to IDF, or to the measure of the --stats file)")
+    parser.add_option("", "--stopwords", dest="stopwords", default=None,
+                      action="store", type="string", metavar="FILE",
+                      help="file containing a list of stopwords")
+    parser.add_option("", "--multitag_size", dest="multitag_size", default=3,
+                      action="store", type="int", metavar="TAG_SIZE",
+                      help="max words per tag")
+    parser.add_option("", "--tags_number", dest="tags_number", default=5,
+                      action="store", type="int", metavar="TAGS_NUMBER",
+                      help="number of tags to return per document")
+    parser.add_option("-j", "--jobs", dest="jobs", default=1,
+                      action="store", type="int", metavar="N",
+                      help="worker processes (0 for the number of CPUs)")
+    parser.add_option("", "--chunksize", dest="chunksize", default=16,
+                      action="store", type="int", metavar="N",
+                      help="documents sent to a worker at once (when "
+                           "counting and when tagging)")
+    parser.add_option("", "--pattern", dest="pattern", default="*",
+                      action="store", type="string", metavar="PATTERN",
+                      help="pattern of the files read from a directory")
+    parser.add_option("", "--id_field", dest="id_field", default="id",
+                      action="store", type="string", metavar="FIELD",
+                      help="field of the input holding the id")
+    parser.add_option("", "--text_field", dest="text_field", default="text",
+                      action="store", type="string", metavar="FIELD",
+                      help="field of the input holding the text")
+    parser.add_option("-q", "--quiet", dest="quiet", default=False,
+                      action="store_true",
+                      help="don't report the progress")
+
+    (options, args) = parser.parse_args()
+
+    if len(args) != 1:
+        parser.print_usage()
+        exit(1)
+
+    def documents():
+        return read_collection(args[0], options.pattern, options.id_field,
+                               options.text_field, sys.stderr)
+
+    tagger = Tagger(Reader(), Stemmer(),
+                    Rater(LazyWeights(options.dictionary),
+                          multitag_size=options.multitag_size))
+
+    stopwords = None
+    if options.stopwords:
+        with open(options.stopwords, 'r') as sw:
+            stopwords = [w.stem for w in map(tagger.stemmer,
+                                             tagger.reader(sw.read()))]
+
+    stats = None
+    if options.stats and os.path.exists(options.stats):
+        stats = DictionaryStats(path=options.stats)
+        # the saved statistics keep their own measure and stopwords, which
+        # must not silently override the ones asked for
+        if options.measure and options.measure != stats.measure:
+            parser.error('%s was counted with --measure %s, not %s' % (
+                options.stats, stats.measure, options.measure))
+        if stopwords is not None and set(stopwords) != stats.stopwords:
+            parser.error('%s was counted with other stopwords than %s' % (
+                options.stats, options.stopwords))
+
+    out = io.TextIOWrapper(io.BufferedWriter(sys.stdout.buffer, 1 << 20),
+                           encoding='utf-8', write_through=False)
+
+    try:
+        counted = tag_corpus(documents, tagger, out, options.alpha,
+                             options.measure or 'IDF', stopwords, stats,
+                             options.tags_number, options.jobs or None,
+                             options.chunksize,
+                             None if options.quiet else sys.stderr)
+    finally:
+        out.flush()
+
+    if options.stats and stats is None:
+        counted.save(options.stats)
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+'''
+Detection of near-duplicate documents, to reuse their tags instead of
+rating them again
+
+A L{Tagger} given a L{DuplicateIndex} computes the MinHash signature of the
+stems of each document before rating it; if a document already tagged has
+an estimated similarity over the threshold, its tags are returned at once.
+Syndicated stories that only differ by a header or a byline are thus rated
+only once::
+
+    index = DuplicateIndex(threshold=0.8)
+    mytagger = Tagger(Reader(), Stemmer(), Rater(weights), dedup=index)
+    for text in documents:
+        mytagger(text)
+    print(index.stats())
+
+(the index is per process: the workers started by L{Tagger.tag_many} keep
+their own copies)
+'''
+
+import collections
+import random
+import threading
+import zlib
+
+
+# a Mersenne prime larger than the hashes of the shingles
+PRIME = (1 << 61) - 1
+
+
+class DuplicateIndex:
+    '''
+    Bounded MinHash/LSH index of the documents tagged most recently, with
+    LRU eviction (it can be used by many threads at once)
+    '''
+
+    def __init__(self, threshold=0.8, maxsize=10000, num_perm=64, bands=16,
+                 shingle_size=3, seed=1):
+        '''
+        @param threshold:    the minimum estimated Jaccard similarity of the
+                             shingles of two documents for one to reuse the
+                             tags of the other
+        @param maxsize:      maximum number of documents kept in the index
+        @param num_perm:     number of minimum hashes in a signature
+        @param bands:        number of bands of the signatures in the LSH
+                             index (it must divide num_perm; more bands find
+                             more candidates at lower similarities)
+        @param shingle_size: number of consecutive stems in a shingle
+        @param seed:         seed of the hash functions (the signatures of
+                             indexes with different seeds can't be compared)
+
+        @returns: a new L{DuplicateIndex} object
+        '''
+
+        if num_perm % bands:
+            raise ValueError('%d bands do not divide %d hashes' % (
+                bands, num_perm))
+
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.reused = 0
+        self.tagged = 0
+        self.evictions = 0
+
+        rng = random.Random(seed)
+        self._permutation = (rng.randrange(1, PRIME), rng.randrange(PRIME))
+        # id -> (signature, tags number, tags), least recently used first
+        self._entries = collections.OrderedDict()
+        # (band, hashes of the band) -> ids of the documents
+        self._buckets = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def signature(self, tags):
+        '''
+        @param tags: a list of stemmed tags
+
+        @returns: the MinHash signature of the shingles of the stems, as a
+                  tuple of integers (None if the document is too short to be
+                  compared)
+        '''
+
+        size = self.shingle_size
+        stems = [t.stem for t in tags]
+        if len(stems) < size:
+            return None
+
+        # one permutation hashing: each shingle is hashed once, the hashes
+        # are split into num_perm bins, and the minimum of each bin stands
+        # for the minimum of a whole permutation
+        a, b = self._permutation
+        k = self.num_perm
+        mins = [PRIME] * k
+        for shingle in set(' '.join(stems[i:i + size])
+                           for i in range(len(stems) - size + 1)):
+            h = (a * zlib.crc32(shingle.encode('utf-8')) + b) % PRIME
+            i = h % k
+            if h < mins[i]:
+                mins[i] = h
+
+        # the empty bins borrow the minimum of the next bin that isn't
+        # (densification), so that short documents stay comparable
+        if PRIME in mins:
+            filled = [i for i in range(k) if mins[i] != PRIME]
+            if not filled:
+                return None
+            for i in range(k):
+                if mins[i] == PRIME:
+                    j = next((j for j in filled if j > i), filled[0])
+                    mins[i] = mins[j] + (j - i) % k
+
+        return tuple(mins)
+
+    def _bands(self, signature):
+        rows = self.num_perm // self.bands
+        return [(band, signature[band * rows:(band + 1) * rows])
+                for band in range(self.bands)]
+
+    def get(self, signature, tags_number):
+        '''
+        @param signature:   a signature returned by L{DuplicateIndex.signature}
+        @param tags_number: number of best tags needed
+
+        @returns: the tags of the most similar document in the index, if it
+                  is similar enough and has at least tags_number tags (or was
+                  tagged for as many), otherwise None
+        '''
+
+        if signature is None:
+            return None
+
+        with self._lock:
+            candidates = set()
+            for key in self._bands(signature):
+                candidates.update(self._buckets.get(key, ()))
+
+            best, similarity = None, self.threshold
+            for doc_id in candidates:
+                other, number, tags = self._entries[doc_id]
+                if number < tags_number:
+                    continue
+                same = sum(1 for x, y in zip(signature, other) if x == y)
+                if same >= similarity * self.num_perm:
+                    best, similarity = doc_id, float(same) / self.num_perm
+
+            if best is None:
+                return None
+
+            self._entries.move_to_end(best)
+            self.reused += 1
+            return self._entries[best][2][:tags_number]
+
+    def put(self, signature, tags_number, tags):
+        '''
+        @param signature:   a signature returned by L{DuplicateIndex.signature}
+        @param tags_number: number of best tags the document was tagged for
+        @param tags:        the tags of the document
+        '''
+
+        with self._lock:
+            self.tagged += 1
+            if signature is None:
+                return
+
+            doc_id = self._next_id
+            self._next_id += 1
+            self._entries[doc_id] = (signature, tags_number, tags)
+            for key in self._bands(signature):
+                self._buckets.setdefault(key, []).append(doc_id)
+
+            if len(self._entries) > self.maxsize:
+                self._evict()
+
+    def _evict(self):
+        doc_id, (signature, number, tags) = self._entries.popitem(last=False)
+        for key in self._bands(signature):
+            bucket = self._buckets[key]
+            bucket.remove(doc_id)
+            if not bucket:
+                del self._buckets[key]
+        self.evictions += 1
+
+    def stats(self):
+        '''
+        @returns: a dictionary with the number of documents whose tags were
+                  reused and of those tagged afresh so far, the reuse rate,
+                  the evictions and the current size of the index
+        '''
+
+        with self._lock:
+            total = self.reused + self.tagged
+            return {'reused': self.reused, 'tagged': self.tagged,
+                    'reuse_rate': self.reused / float(total) if total else 0.0,
+                    'evictions': self.evictions, 'size': len(self._entries)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
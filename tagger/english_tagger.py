@@ -18,9 +18,9 @@ class EnglishTagger(Tagger):
             self.stemmer = Stemmer()
 
         if self.rater is None and dictionary_path is not None:
-            import pickle
-            with open(dictionary_path, 'rb') as fh:
-                weights = pickle.load(fh)
+            from tagger.weights import LazyWeights
+            # the dictionary is loaded when the first text is tagged
+            weights = LazyWeights(dictionary_path)
             self.rater = Rater(weights, multitag_size=1)
 
 
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+'''
+Export of the tags of many documents as a sparse document-term matrix, to
+be used as features (e.g. for clustering)
+
+Each row is a document, each column a tag of the shared vocabulary, and the
+values are the ratings of the tags::
+
+    vocabulary = {}
+    matrix = tag_matrix(mytagger, documents, vocabulary=vocabulary, workers=8)
+    names = list(vocabulary)  # the tag of each column
+
+The documents are tagged in chunks (on worker processes if requested), and
+every chunk is built as compressed sparse rows over its own vocabulary,
+which are then renumbered with the shared vocabulary and concatenated: no
+dense row is ever built, and the memory only grows with the number of
+non-zero entries.
+
+Dependencies:
+numpy
+scipy (optional, for L{tag_matrix})
+'''
+
+import array
+
+import numpy
+
+from . import parallel
+
+
+def chunk_rows(tagger, texts, tags_number):
+    '''
+    @param tagger:      the L{Tagger} object to be used
+    @param texts:       a list of strings of text to be tagged
+    @param tags_number: number of best tags to be returned for each text
+
+    @returns: the compressed sparse rows of the texts over a vocabulary of
+              their own, as a tuple (tag strings, indptr, indices, data)
+    '''
+
+    columns = {}
+    indptr = array.array('q', [0])
+    indices = array.array('q')
+    data = array.array('d')
+
+    for text in texts:
+        for tag in tagger(text, tags_number):
+            # a tag can only come once per document
+            indices.append(columns.setdefault(tag.string, len(columns)))
+            data.append(tag.rating)
+        indptr.append(len(indices))
+
+    return list(columns), indptr, indices, data
+
+
+def _chunk_rows(texts, tags_number):
+    return [chunk_rows(parallel._tagger, texts, tags_number)]
+
+
+def tag_chunks(tagger, texts, tags_number=10, vocabulary=None, grow=True,
+               workers=1, chunksize=256):
+    '''
+    @param tagger:      the L{Tagger} object to be used
+    @param texts:       an iterable of strings of text to be tagged (it is
+                        consumed lazily)
+    @param tags_number: number of best tags to be returned for each text
+    @param vocabulary:  a dictionary mapping the tags to their columns,
+                        shared by all the chunks (and possibly by other
+                        calls); the new tags are added to it
+    @param grow:        if False, the tags missing from the vocabulary are
+                        dropped instead of added
+    @param workers:     number of worker processes (None for the number of
+                        CPUs; 1 tags the texts in this process)
+    @param chunksize:   number of texts tagged by a worker at once
+
+    @returns: an iterator over the compressed sparse rows of each chunk of
+              texts, in order, as NumPy arrays (indptr, indices, data)
+    '''
+
+    if vocabulary is None:
+        vocabulary = {}
+
+    if workers == 1:
+        chunks = (chunk_rows(tagger, chunk, tags_number)
+                  for chunk in parallel.chunked(texts, chunksize))
+    else:
+        chunks = parallel.imap(_chunk_rows, texts, (tags_number,),
+                               workers=workers, chunksize=chunksize,
+                               initializer=parallel.init_tagger,
+                               initargs=(tagger,))
+
+    for strings, indptr, indices, data in chunks:
+        # the columns of the chunk are renumbered with the shared vocabulary
+        if grow:
+            renumber = [vocabulary.setdefault(s, len(vocabulary))
+                        for s in strings]
+        else:
+            renumber = [vocabulary.get(s, -1) for s in strings]
+
+        renumber = numpy.array(renumber, dtype=numpy.int64)
+        indptr = numpy.frombuffer(indptr, dtype=numpy.int64)
+        indices = renumber[numpy.frombuffer(indices, dtype=numpy.int64)]
+        data = numpy.frombuffer(data, dtype=numpy.float64)
+
+        if not grow:
+            known = indices >= 0
+            if not known.all():
+                indptr = numpy.concatenate(
+                    ([0], numpy.cumsum(known)))[indptr]
+                indices = indices[known]
+                data = data[known]
+
+        yield indptr, indices, data
+
+
+def tag_csr(tagger, texts, tags_number=10, vocabulary=None, grow=True,
+            workers=1, chunksize=256):
+    '''
+    Same arguments as L{tag_chunks}
+
+    @returns: the compressed sparse rows of all the texts, as NumPy arrays
+              (indptr, indices, data)
+    '''
+
+    indptrs = [numpy.zeros(1, dtype=numpy.int64)]
+    indices = []
+    data = []
+    offset = 0
+
+    for chunk_indptr, chunk_indices, chunk_data in tag_chunks(
+            tagger, texts, tags_number, vocabulary, grow, workers, chunksize):
+        indptrs.append(chunk_indptr[1:] + offset)
+        indices.append(chunk_indices)
+        data.append(chunk_data)
+        offset += len(chunk_indices)
+
+    return (numpy.concatenate(indptrs),
+            numpy.concatenate(indices or [numpy.zeros(0, numpy.int64)]),
+            numpy.concatenate(data or [numpy.zeros(0)]))
+
+
+def tag_coo(tagger, texts, tags_number=10, vocabulary=None, grow=True,
+            workers=1, chunksize=256):
+    '''
+    Same arguments as L{tag_chunks}
+
+    @returns: the coordinates of the matrix, as NumPy arrays (rows, columns,
+              data)
+    '''
+
+    indptr, indices, data = tag_csr(tagger, texts, tags_number, vocabulary,
+                                    grow, workers, chunksize)
+    rows = numpy.repeat(numpy.arange(len(indptr) - 1), numpy.diff(indptr))
+
+    return rows, indices, data
+
+
+def tag_matrix(tagger, texts, tags_number=10, vocabulary=None, grow=True,
+               workers=1, chunksize=256):
+    '''
+    Same arguments as L{tag_chunks}
+
+    @returns: a scipy.sparse.csr_matrix with a row for each text and a column
+              for each tag of the vocabulary (its shape follows the
+              vocabulary as it is after tagging the texts)
+    '''
+
+    from scipy import sparse
+
+    if vocabulary is None:
+        vocabulary = {}
+
+    indptr, indices, data = tag_csr(tagger, texts, tags_number, vocabulary,
+                                    grow, workers, chunksize)
+
+    return sparse.csr_matrix((data, indices, indptr),
+                             shape=(len(indptr) - 1, len(vocabulary)))
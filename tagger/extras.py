@@ -1,3 +1,5 @@
+import itertools
+
 from .tagger import *
 
 
@@ -11,7 +13,8 @@ class UnicodeReader(Reader):
         import unicodedata
 
         text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore')
-        return Reader.__call__(self, text)
+        # the regular expressions of the Reader work on strings, not bytes
+        return Reader.__call__(self, text.decode('ascii'))
 
 
 class HTMLReader(UnicodeReader):
@@ -29,6 +32,80 @@ class HTMLReader(UnicodeReader):
             return Reader.__call__(self, text)
 
 
+class StreamingHTMLReader(UnicodeReader):
+    '''
+    Reader subclass that parses HTML code incrementally, skipping scripts,
+    styles and navigation menus
+
+    (the text is tokenized a few paragraphs at a time, as soon as it is
+    parsed, so memory stays bounded on large pages and the first tags are
+    available before the whole page is read)
+    '''
+
+    # elements whose content is not part of the text
+    skip_elements = frozenset(['script', 'style', 'nav', 'noscript',
+                               'template'])
+    # elements starting or ending a paragraph
+    block_elements = frozenset(['address', 'article', 'aside', 'blockquote',
+                                'br', 'dd', 'div', 'dl', 'dt', 'figcaption',
+                                'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5',
+                                'h6', 'header', 'hr', 'li', 'main', 'ol', 'p',
+                                'pre', 'section', 'table', 'td', 'th', 'title',
+                                'tr', 'ul'])
+    # characters splitting paragraphs (see Reader.match_paragraphs)
+    paragraph_delimiters = '.?!\t\n\r\f\v'
+
+    def __init__(self, max_buffer=1 << 16):
+        '''
+        @param max_buffer: number of characters of text without any paragraph
+                           delimiter after which the text is split anyway (at
+                           a space)
+
+        @returns: a new L{StreamingHTMLReader} object
+        '''
+
+        self.max_buffer = max_buffer
+
+    def __call__(self, html):
+        return list(self.stream([html]))
+
+    def stream(self, chunks):
+        '''
+        @param chunks: an iterable of strings of HTML code (e.g. the blocks
+                       of a file or of a network response)
+
+        @returns: an iterator over the tags, respecting the order in the text
+        '''
+
+        # the HTML parser is only imported by the readers that need it
+        from .htmltext import TextExtractor
+
+        parser = TextExtractor(self.skip_elements, self.block_elements)
+        buffer = ''
+
+        for chunk in itertools.chain(chunks, [None]):
+            if chunk is None:
+                parser.close()
+            else:
+                parser.feed(chunk)
+            buffer += ''.join(parser.pieces)
+            del parser.pieces[:]
+
+            if chunk is None:
+                cut = len(buffer)
+            else:
+                # the reader starts afresh after a paragraph delimiter, so
+                # the text up to the last one can be tokenized already
+                cut = max(buffer.rfind(c) for c in self.paragraph_delimiters) + 1
+                if not cut and len(buffer) > self.max_buffer:
+                    cut = buffer.rfind(' ') + 1 or len(buffer)
+
+            if cut:
+                for tag in UnicodeReader.__call__(self, buffer[:cut]):
+                    yield tag
+                buffer = buffer[cut:]
+
+
 class SimpleReader(Reader):
     '''
     Reader subclass that doesn't perform any advanced analysis of the text
@@ -47,10 +124,10 @@ class FastStemmer(Stemmer):
     Stemmer subclass that uses a much faster, but less correct algorithm
     '''
 
-    def __init__(self):
+    def __init__(self, cache=None):
         from stemming import porter
 
-        Stemmer.__init__(self, porter)
+        Stemmer.__init__(self, porter, cache=cache)
 
 
 class NaiveRater(Rater):
@@ -59,23 +136,20 @@ class NaiveRater(Rater):
     weight
     '''
 
-    def __call__(self, tags):
-        self.rate_tags(tags)
-        # we still get rid of one-character tags and stopwords
-        unique_tags = set(t for t in tags
-                          if len(t.string) > 1 and t.rating > 0.0)
-        return sorted(unique_tags)
+    def __call__(self, tags, k=None, stats=None):
+        return self.rate_unigrams(tags, k, stats)
 
 
 def build_dict_from_nltk(output_file, corpus=None, stopwords=None,
-                         stemmer=Stemmer(), measure='IDF', verbose=False):
+                         stemmer=None, measure='IDF', verbose=False):
     '''
     @param output_file: the name of the file where the dictionary should be
                         saved
     @param corpus:      the NLTK corpus to use (defaults to nltk.corpus.reuters)
     @param stopwords:   a list of (not stemmed) stopwords (defaults to
                         nltk.corpus.reuters.words('stopwords'))
-    @param stemmer:     the L{Stemmer} object to be used
+    @param stemmer:     the L{Stemmer} object to be used (defaults to
+                        L{Stemmer})
     @param measure:     the measure used to compute the weights ('IDF'
                         i.e. 'inverse document frequency' or 'ICF' i.e.
                         'inverse collection frequency'; defaults to 'IDF')
@@ -83,29 +157,30 @@ def build_dict_from_nltk(output_file, corpus=None, stopwords=None,
                         on screen
     '''
 
-    from .build_dict import build_dict
+    from .build_dict import build_dict_from_counts, count_terms
     import nltk
     import pickle
 
     if not (corpus and stopwords):
         nltk.download('reuters')
 
+    stemmer = stemmer or Stemmer()
     corpus = corpus or nltk.corpus.reuters
     stopwords = stopwords or nltk.corpus.reuters.words('stopwords')
 
-    corpus_list = []
+    # the documents are read and stemmed one at a time while counting
+    corpus_docs = ([stemmer(Tag(w.lower())).stem for w in corpus.words(file)
+                    if w[0].isalpha()]
+                   for file in corpus.fileids())
 
     if verbose: print('Processing corpus...')
-    for file in corpus.fileids():
-        doc = [stemmer(Tag(w.lower())).stem for w in corpus.words(file)
-               if w[0].isalpha()]
-        corpus_list.append(doc)
+    counts = count_terms(corpus_docs)
 
     if verbose: print('Processing stopwords...')
     stopwords = [stemmer(Tag(w.lower())).stem for w in stopwords]
 
     if verbose: print('Building dictionary... ')
-    dictionary = build_dict(corpus_list, stopwords, measure)
+    dictionary = build_dict_from_counts(counts, stopwords, measure)
     with open(output_file, 'wb') as out:
         pickle.dump(dictionary, out, protocol=2)
 
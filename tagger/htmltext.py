@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+'''
+Incremental extraction of the text of HTML pages, for the
+L{StreamingHTMLReader}
+'''
+
+from html.parser import HTMLParser
+
+
+class TextExtractor(HTMLParser):
+    '''
+    Incremental HTML parser collecting the pieces of text of a page
+    '''
+
+    def __init__(self, skip_elements, block_elements):
+        '''
+        @param skip_elements:  the names of the elements whose content should
+                               be skipped
+        @param block_elements: the names of the elements that should be
+                               separated from the surrounding text by a
+                               newline
+
+        @returns: a new L{TextExtractor} object
+        '''
+
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.skip_elements = skip_elements
+        self.block_elements = block_elements
+        self.skipping = 0
+        # the pieces of text parsed so far, to be consumed by the caller
+        self.pieces = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.skip_elements:
+            self.skipping += 1
+        elif tag in self.block_elements and not self.skipping:
+            self.pieces.append('\n')
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in self.block_elements and not self.skipping:
+            self.pieces.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in self.skip_elements:
+            if self.skipping:
+                self.skipping -= 1
+        elif tag in self.block_elements and not self.skipping:
+            self.pieces.append('\n')
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.pieces.append(data)
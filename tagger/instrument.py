@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+'''
+Instrumentation of the tagging pipeline
+
+A L{Tagger} given an L{Instrument} measures the wall time spent in each stage
+(reader, stemmer, rater) and counts the tokens, multitags (generated or
+avoided), candidate tags and pruned tags of every document; each of these
+records is passed to a number of sinks. A sink is any callable taking a
+record (a dictionary), so a plain function works as a callback; L{Aggregate}
+keeps percentiles in memory and L{Prometheus} renders them in the Prometheus
+text exposition format::
+
+    aggregate = Aggregate()
+    mytagger = Tagger(Reader(), Stemmer(), Rater(weights),
+                      instrument=Instrument(aggregate, print))
+    mytagger(text)
+    print(aggregate.summary())
+
+(the instrumentation is per process: the workers started by
+L{Tagger.tag_many} record into their own copies of the sinks)
+'''
+
+import collections
+import math
+import threading
+
+
+# the timings in a record, in seconds
+STAGES = ('reader', 'stemmer', 'rater', 'total')
+# the counters in a record
+COUNTERS = ('tokens', 'multitags', 'avoided', 'candidates', 'pruned', 'tags',
+            'reused')
+
+
+class Instrument:
+    '''
+    Class dispatching the records of an instrumented L{Tagger} to its sinks
+    '''
+
+    def __init__(self, *sinks):
+        '''
+        @param sinks: callables taking a record, i.e. a dictionary with the
+                      timings of each stage ('reader', 'stemmer', 'rater',
+                      'total') and the counters ('tokens', 'multitags',
+                      'avoided', 'candidates', 'pruned', 'tags' and, with a
+                      L{DuplicateIndex}, 'reused') of a document
+
+        @returns: a new L{Instrument} object
+        '''
+
+        self.sinks = list(sinks)
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def record(self, record):
+        '''
+        @param record: the timings and counters of a tagged document
+        '''
+
+        for sink in self.sinks:
+            sink(record)
+
+
+class Aggregate:
+    '''
+    Sink keeping running totals of every metric, and its values over a
+    sliding window of documents to compute percentiles (it can be shared by
+    a L{Tagger} used from many threads)
+    '''
+
+    def __init__(self, window=10000, metrics=STAGES + COUNTERS):
+        '''
+        @param window:  number of recent documents the percentiles are
+                        computed on
+        @param metrics: the names of the metrics to be aggregated (the other
+                        entries of the records are ignored)
+
+        @returns: a new L{Aggregate} object
+        '''
+
+        self.window = window
+        self.metrics = tuple(metrics)
+        self._lock = threading.RLock()
+        self.reset()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.counts = dict.fromkeys(self.metrics, 0)
+            self.sums = dict.fromkeys(self.metrics, 0)
+            self.values = dict((m, collections.deque(maxlen=self.window))
+                               for m in self.metrics)
+
+    def __call__(self, record):
+        with self._lock:
+            self.count += 1
+            for metric, value in record.items():
+                if metric in self.sums:
+                    self.counts[metric] += 1
+                    self.sums[metric] += value
+                    self.values[metric].append(value)
+
+    def percentile(self, metric, p):
+        '''
+        @param metric: the name of a timing or counter
+        @param p:      the percentile, in the interval [0,100]
+
+        @returns: the p-th percentile of the metric over the window (nearest
+                  rank), or None if nothing was recorded yet
+        '''
+
+        with self._lock:
+            values = sorted(self.values[metric])
+        if not values:
+            return None
+        rank = max(int(math.ceil(p / 100.0 * len(values))), 1)
+        return values[rank - 1]
+
+    def summary(self, percentiles=(50, 90, 99)):
+        '''
+        @param percentiles: the percentiles to be computed for each metric
+
+        @returns: a dictionary with the count, sum, mean and percentiles of
+                  each metric
+        '''
+
+        summary = {}
+
+        with self._lock:
+            for metric, values in self.values.items():
+                if not values:
+                    continue
+                count = self.counts[metric]
+                stats = {'count': count, 'sum': self.sums[metric],
+                         'mean': self.sums[metric] / float(count)}
+                for p in percentiles:
+                    stats['p%g' % p] = self.percentile(metric, p)
+                summary[metric] = stats
+
+        return summary
+
+
+class Prometheus(Aggregate):
+    '''
+    Sink rendering the aggregated metrics in the Prometheus text exposition
+    format (the stage timings as summaries, the counters as counters)
+    '''
+
+    def __init__(self, prefix='tagger', window=10000,
+                 quantiles=(0.5, 0.9, 0.99)):
+        '''
+        @param prefix:    prefix of the names of the metrics
+        @param window:    number of recent documents the quantiles are
+                          computed on
+        @param quantiles: the quantiles exposed for each stage
+
+        @returns: a new L{Prometheus} object
+        '''
+
+        Aggregate.__init__(self, window)
+        self.prefix = prefix
+        self.quantiles = quantiles
+
+    def exposition(self):
+        '''
+        @returns: the metrics as a string in the Prometheus text format
+        '''
+
+        with self._lock:
+            return self._exposition()
+
+    def _exposition(self):
+        name = self.prefix + '_stage_seconds'
+        lines = ['# HELP %s Wall time spent in each stage of the tagger.' % name,
+                 '# TYPE %s summary' % name]
+
+        for stage in STAGES:
+            for q in self.quantiles:
+                value = self.percentile(stage, q * 100)
+                lines.append('%s{stage="%s",quantile="%g"} %s' % (
+                    name, stage, q, 'NaN' if value is None else repr(value)))
+            lines.append('%s_sum{stage="%s"} %r' % (name, stage,
+                                                     float(self.sums[stage])))
+            lines.append('%s_count{stage="%s"} %d' % (name, stage,
+                                                      self.counts[stage]))
+
+        name = self.prefix + '_documents_total'
+        lines += ['# HELP %s Documents tagged.' % name,
+                  '# TYPE %s counter' % name,
+                  '%s %d' % (name, self.count)]
+
+        for counter in COUNTERS:
+            name = '%s_%s_total' % (self.prefix, counter)
+            lines += ['# HELP %s Number of %s over all the documents.' % (
+                          name, counter),
+                      '# TYPE %s counter' % name,
+                      '%s %d' % (name, self.sums[counter])]
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+'''
+Helpers for running the tagging pipeline on a pool of worker processes (or
+threads)
+'''
+
+import collections
+import itertools
+import os
+from concurrent import futures
+
+
+# the tagger owned by each worker process (see init_tagger)
+_tagger = None
+
+
+def init_tagger(tagger):
+    '''
+    Pool initializer: keeps a L{Tagger} in the worker, so the dictionary and
+    the stemmer are loaded once per process instead of once per task
+
+    @param tagger: the L{Tagger} object to be used by the worker
+    '''
+
+    global _tagger
+    _tagger = tagger
+
+
+def tag_chunk(texts, tags_number):
+    '''
+    @param texts:       a list of strings of text to be tagged
+    @param tags_number: number of best tags to be returned for each text
+
+    @returns: a list with the tags of each text, using the worker's tagger
+    '''
+
+    return [_tagger(text, tags_number) for text in texts]
+
+
+def tag_indexed_chunk(items, tags_number):
+    '''
+    @param items:       a list of (index, text) pairs
+    @param tags_number: number of best tags to be returned for each text
+
+    @returns: a list of (index, tags) pairs, using the worker's tagger
+    '''
+
+    return [(i, _tagger(text, tags_number)) for i, text in items]
+
+
+# the records of the instrumented tagger of each worker process (see
+# init_recording_tagger)
+_records = []
+
+
+def init_recording_tagger(tagger):
+    '''
+    Pool initializer: like L{init_tagger}, but the worker's tagger is
+    instrumented, and its records are returned by L{tag_recorded_chunk}
+
+    @param tagger: the L{Tagger} object to be used by the worker
+    '''
+
+    from .instrument import Instrument
+
+    tagger.instrument = Instrument(_records.append)
+    init_tagger(tagger)
+
+
+def tag_recorded_chunk(items):
+    '''
+    @param items: a list of (text, tags_number) pairs
+
+    @returns: the list of the tags (as strings) of each text, and the list of
+              the records of the texts (see L{Instrument}), using the
+              worker's tagger; a text that fails gets the exception instead
+              of its tags, so that it doesn't fail the others
+    '''
+
+    results = []
+
+    for text, tags_number in items:
+        try:
+            results.append([t.string for t in _tagger(text, tags_number)])
+        except Exception as e:
+            results.append(e)
+
+    records = _records[:]
+    del _records[:]
+
+    return results, records
+
+
+def chunked(iterable, size):
+    '''
+    @param iterable: any iterable
+    @param size:     the maximum size of each chunk
+
+    @returns: an iterator over lists of (at most) size consecutive items
+    '''
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def imap(function, iterable, args=(), workers=None, chunksize=1,
+         ordered=True, initializer=None, initargs=(), backlog=2,
+         threads=False):
+    '''
+    Lazy, parallel version of map with backpressure: the iterable is consumed
+    only as fast as the workers process it
+
+    @param function:    a picklable function (any callable if threads is True)
+                        taking a list of items (followed by args) and
+                        returning a list of results
+    @param iterable:    the items to be processed
+    @param args:        additional arguments for the function
+    @param workers:     number of workers (defaults to the number of CPUs)
+    @param chunksize:   number of items sent to a worker at once
+    @param ordered:     whether the results should respect the order of the
+                        input (otherwise they are returned as soon as ready)
+    @param initializer: function run once by each worker when started
+    @param initargs:    arguments for the initializer
+    @param backlog:     number of chunks per worker that can be waiting in
+                        the queue
+    @param threads:     if True, the workers are threads of this process
+                        instead of processes (nothing is pickled, and the
+                        function can use objects shared by all the workers)
+
+    @returns: an iterator over the results
+    '''
+
+    workers = workers or os.cpu_count() or 1
+    limit = workers * backlog
+    if threads:
+        executor = futures.ThreadPoolExecutor
+    else:
+        executor = futures.ProcessPoolExecutor
+
+    with executor(workers, initializer=initializer,
+                  initargs=initargs) as pool:
+        if ordered:
+            pending = collections.deque()
+            for chunk in chunked(iterable, chunksize):
+                if len(pending) >= limit:
+                    for result in pending.popleft().result():
+                        yield result
+                pending.append(pool.submit(function, chunk, *args))
+            while pending:
+                for result in pending.popleft().result():
+                    yield result
+        else:
+            pending = set()
+            for chunk in chunked(iterable, chunksize):
+                if len(pending) >= limit:
+                    done, pending = futures.wait(
+                        pending, return_when=futures.FIRST_COMPLETED)
+                    for future in done:
+                        for result in future.result():
+                            yield result
+                pending.add(pool.submit(function, chunk, *args))
+            for future in futures.as_completed(pending):
+                for result in future.result():
+                    yield result
@@ -0,0 +1,440 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Usage: python -m tagger.serve [options]
+
+Local HTTP server tagging documents, with JSON in and JSON out
+
+Concurrent requests are gathered into micro-batches (of at most --max_batch
+texts, waiting at most --max_wait milliseconds for a batch to fill up), which
+are tagged by a pool of worker processes keeping the dictionary and the
+stemmer loaded. Endpoints::
+
+    POST /tag      {"text": "...", "tags_number": 5}  ->  {"tags": [...]}
+                   {"texts": ["...", ...]}            ->  {"tags": [[...], ...]}
+    GET  /health   the status of the server, as JSON
+    GET  /metrics  the metrics of the server and of the tagger's stages, in the
+                   Prometheus text format
+'''
+
+import asyncio
+import collections
+import json
+import os
+import time
+from concurrent import futures
+
+from . import parallel
+from .instrument import Aggregate, Prometheus
+from .tagger import Tagger, Reader, Stemmer, Rater
+
+
+class Batcher:
+    '''
+    Class gathering the texts to be tagged into micro-batches, which are run
+    on a pool of worker processes
+
+    (while all the workers are busy, the texts keep queueing up, so the
+    batches grow with the load)
+    '''
+
+    def __init__(self, tagger, workers=None, max_batch=32, max_wait=0.002,
+                 backlog=2):
+        '''
+        @param tagger:    the L{Tagger} object to be used by the workers
+        @param workers:   number of worker processes (defaults to the number
+                          of CPUs)
+        @param max_batch: maximum number of texts in a batch
+        @param max_wait:  maximum time a batch waits to fill up, in seconds
+        @param backlog:   number of batches per worker that can be waiting
+                          in the pool
+
+        @returns: a new L{Batcher} object
+        '''
+
+        self.tagger = tagger
+        self.workers = workers or os.cpu_count() or 1
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.backlog = backlog
+
+        self.in_flight = 0
+        self.batches = 0
+        self.errors = 0
+        self.failed_texts = 0
+        self.batch_sizes = Aggregate(metrics=('size',))
+        self.stages = Prometheus()
+
+        self.pool = None
+        self._queue = None
+
+    async def start(self):
+        '''
+        Starts the worker processes, and waits until they are ready
+        '''
+
+        loop = asyncio.get_event_loop()
+
+        self._queue = collections.deque()
+        self._arrived = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.workers * self.backlog)
+        self.pool = futures.ProcessPoolExecutor(
+            self.workers, initializer=parallel.init_recording_tagger,
+            initargs=(self.tagger,))
+
+        # the dictionary and the stemmer are loaded before the first request
+        await asyncio.gather(*[
+            loop.run_in_executor(self.pool, parallel.tag_recorded_chunk,
+                                 [('warm up', 1)])
+            for _ in range(self.workers)])
+
+        self._task = loop.create_task(self.run())
+
+    async def stop(self):
+        self._task.cancel()
+        # the workers are joined without blocking the event loop
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.pool.shutdown)
+
+    def __len__(self):
+        return len(self._queue)
+
+    async def tag(self, text, tags_number):
+        '''
+        @param text:        the string of text to be tagged
+        @param tags_number: number of best tags to be returned
+
+        @returns: the list of the tags of the text, as strings
+        '''
+
+        future = asyncio.get_event_loop().create_future()
+        self._queue.append((text, tags_number, future))
+        self._arrived.set()
+
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        queue = self._queue
+
+        while True:
+            # a batch is only started when a worker can take it
+            await self._slots.acquire()
+
+            while not queue:
+                self._arrived.clear()
+                await self._arrived.wait()
+
+            deadline = loop.time() + self.max_wait
+            while len(queue) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                self._arrived.clear()
+                try:
+                    await asyncio.wait_for(self._arrived.wait(), timeout)
+                except asyncio.TimeoutError:
+                    break
+
+            batch = [queue.popleft()
+                     for _ in range(min(len(queue), self.max_batch))]
+            loop.create_task(self.dispatch(batch))
+
+    async def dispatch(self, batch):
+        loop = asyncio.get_event_loop()
+
+        self.in_flight += 1
+        self.batches += 1
+        self.batch_sizes({'size': len(batch)})
+
+        try:
+            results, records = await loop.run_in_executor(
+                self.pool, parallel.tag_recorded_chunk,
+                [(text, tags_number) for text, tags_number, future in batch])
+        except Exception as e:
+            self.errors += 1
+            for text, tags_number, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for record in records:
+                self.stages(record)
+            for (text, tags_number, future), tags in zip(batch, results):
+                if isinstance(tags, Exception):
+                    self.failed_texts += 1
+                    if not future.done():
+                        future.set_exception(tags)
+                elif not future.done():
+                    future.set_result(tags)
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+
+class Server:
+    '''
+    Minimal HTTP/1.1 front end (with keep-alive) for a L{Batcher}
+    '''
+
+    reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 413: 'Payload Too Large',
+               500: 'Internal Server Error'}
+
+    def __init__(self, batcher, tags_number=5, max_body=16 << 20):
+        '''
+        @param batcher:     the L{Batcher} object tagging the texts
+        @param tags_number: default number of tags returned for each text
+        @param max_body:    maximum size of a request, in bytes
+
+        @returns: a new L{Server} object
+        '''
+
+        self.batcher = batcher
+        self.tags_number = tags_number
+        self.max_body = max_body
+
+        self.started = time.time()
+        self.requests = 0
+        self.latency = Aggregate(metrics=('seconds',))
+
+    async def handle(self, reader, writer):
+        '''
+        Serves the requests of a connection until it is closed
+        '''
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, path, version = line.decode('latin-1').split()
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > self.max_body:
+                    self.respond(writer, 413, {'error': 'request too large'},
+                                 False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                keep_alive = (version == 'HTTP/1.1' and
+                              headers.get('connection', '').lower() != 'close')
+                status, payload = await self.route(method, path, body)
+                self.respond(writer, status, payload, keep_alive)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def respond(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            content_type = 'text/plain; version=0.0.4'
+            body = payload.encode('utf-8')
+        else:
+            content_type = 'application/json'
+            body = json.dumps(payload).encode('utf-8')
+
+        writer.write(('HTTP/1.1 %d %s\r\n'
+                      'Content-Type: %s\r\n'
+                      'Content-Length: %d\r\n'
+                      'Connection: %s\r\n\r\n' % (
+                          status, self.reasons[status], content_type,
+                          len(body), 'keep-alive' if keep_alive else 'close')
+                      ).encode('latin-1') + body)
+
+    async def route(self, method, path, body):
+        '''
+        @returns: the status code and the payload of the response (a string
+                  for plain text, any other object is encoded as JSON)
+        '''
+
+        path = path.split('?', 1)[0]
+
+        if path == '/tag':
+            if method != 'POST':
+                return 405, {'error': 'use POST'}
+            return await self.tag(body)
+        elif path == '/health':
+            if method != 'GET':
+                return 405, {'error': 'use GET'}
+            return 200, self.health()
+        elif path == '/metrics':
+            if method != 'GET':
+                return 405, {'error': 'use GET'}
+            return 200, self.metrics()
+
+        return 404, {'error': 'unknown path %s' % path}
+
+    async def tag(self, body):
+        start = time.perf_counter()
+
+        try:
+            request = json.loads(body.decode('utf-8'))
+            tags_number = int(request.get('tags_number', self.tags_number))
+            if 'texts' in request:
+                texts = request['texts']
+                single = False
+                if not isinstance(texts, list):
+                    raise TypeError('texts must be a list')
+            else:
+                texts = [request['text']]
+                single = True
+            if not all(isinstance(text, str) for text in texts):
+                raise TypeError('texts must be strings')
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return 400, {'error': 'invalid request (%s)' % e}
+
+        try:
+            results = await asyncio.gather(*[
+                self.batcher.tag(text, tags_number) for text in texts])
+        except Exception as e:
+            return 500, {'error': '%s: %s' % (type(e).__name__, e)}
+
+        self.requests += 1
+        self.latency({'seconds': time.perf_counter() - start})
+
+        return 200, {'tags': results[0] if single else results}
+
+    def health(self):
+        return {'status': 'ok', 'uptime': time.time() - self.started,
+                'workers': self.batcher.workers, 'queued': len(self.batcher),
+                'batches_in_flight': self.batcher.in_flight}
+
+    def metrics(self):
+        batcher = self.batcher
+        lines = []
+
+        def metric(name, kind, description, samples):
+            name = 'tagger_' + name
+            lines.append('# HELP %s %s' % (name, description))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for suffix, value in samples:
+                lines.append('%s%s %s' % (name, suffix, value))
+
+        def summary(aggregate, metric_name):
+            samples = []
+            for q in (0.5, 0.9, 0.99):
+                value = aggregate.percentile(metric_name, q * 100)
+                samples.append(('{quantile="%g"}' % q,
+                                'NaN' if value is None else repr(value)))
+            samples.append(('_sum', repr(float(aggregate.sums[metric_name]))))
+            samples.append(('_count', aggregate.counts[metric_name]))
+            return samples
+
+        metric('requests_total', 'counter', 'Tagging requests served.',
+               [('', self.requests)])
+        metric('request_seconds', 'summary', 'Latency of the tagging requests.',
+               summary(self.latency, 'seconds'))
+        metric('batches_total', 'counter', 'Batches sent to the workers.',
+               [('', batcher.batches)])
+        metric('batch_errors_total', 'counter', 'Batches that failed.',
+               [('', batcher.errors)])
+        metric('text_errors_total', 'counter',
+               'Texts that failed in a batch that did not.',
+               [('', batcher.failed_texts)])
+        metric('batch_size', 'summary', 'Number of texts in each batch.',
+               summary(batcher.batch_sizes, 'size'))
+        metric('queued_texts', 'gauge', 'Texts waiting for a batch.',
+               [('', len(batcher))])
+        metric('batches_in_flight', 'gauge', 'Batches being tagged.',
+               [('', batcher.in_flight)])
+
+        return '\n'.join(lines) + '\n' + batcher.stages.exposition()
+
+
+async def serve(tagger, host='127.0.0.1', port=8080, workers=None,
+                max_batch=32, max_wait=0.002, tags_number=5):
+    '''
+    Runs the server until it is cancelled
+
+    @param tagger:      the L{Tagger} object to be used by the workers
+    @param host:        the address to listen on
+    @param port:        the port to listen on
+    @param workers:     number of worker processes (defaults to the number of
+                        CPUs)
+    @param max_batch:   maximum number of texts in a batch
+    @param max_wait:    maximum time a batch waits to fill up, in seconds
+    @param tags_number: default number of tags returned for each text
+    '''
+
+    batcher = Batcher(tagger, workers, max_batch, max_wait)
+    await batcher.start()
+
+    server = Server(batcher, tags_number)
+    listener = await asyncio.start_server(server.handle, host, port)
+    print('Serving on http://%s:%d/ with %d workers' % (host, port,
+                                                         batcher.workers))
+
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await batcher.stop()
+
+
+if __name__ == '__main__':
+
+    from optparse import OptionParser
+    from .weights import LazyWeights
+
+    parser = OptionParser(usage=__doc__.strip())
+    parser.add_option("", "--dict", dest="dictionary", default="data/dict.pkl",
+                      action="store", type="string", metavar="DICT",
+                      help="dictionary for weights (pickled or binary)")
+    parser.add_option("", "--multitag_size", dest="multitag_size", default=3,
+                      action="store", type="int", metavar="TAG_SIZE",
+                      help="max words per tag")
+    parser.add_option("", "--tags_number", dest="tags_number", default=5,
+                      action="store", type="int", metavar="TAGS_NUMBER",
+                      help="default number of tags to return per document")
+    parser.add_option("", "--host", dest="host", default="127.0.0.1",
+                      action="store", type="string", metavar="HOST",
+                      help="address to listen on")
+    parser.add_option("", "--port", dest="port", default=8080,
+                      action="store", type="int", metavar="PORT",
+                      help="port to listen on")
+    parser.add_option("", "--workers", dest="workers", default=None,
+                      action="store", type="int", metavar="N",
+                      help="worker processes (defaults to the number of CPUs)")
+    parser.add_option("", "--max_batch", dest="max_batch", default=32,
+                      action="store", type="int", metavar="N",
+                      help="max texts per batch")
+    parser.add_option("", "--max_wait", dest="max_wait", default=2.0,
+                      action="store", type="float", metavar="MS",
+                      help="max milliseconds a batch waits to fill up")
+    parser.add_option("", "--dedup", dest="dedup", default=None,
+                      action="store", type="float", metavar="SIMILARITY",
+                      help="reuse the tags of near-duplicates this similar")
+
+    (options, args) = parser.parse_args()
+
+    dedup = None
+    if options.dedup is not None:
+        from .dedup import DuplicateIndex
+        dedup = DuplicateIndex(threshold=options.dedup)
+
+    # each worker loads the dictionary by itself (and shares its pages if it
+    # is in the binary format), and keeps its own index of near-duplicates
+    tagger = Tagger(Reader(), Stemmer(),
+                    Rater(LazyWeights(options.dictionary),
+                          multitag_size=options.multitag_size),
+                    dedup=dedup)
+
+    try:
+        asyncio.run(serve(tagger, options.host, options.port, options.workers,
+                          options.max_batch, options.max_wait / 1000.0,
+                          options.tags_number))
+    except KeyboardInterrupt:
+        pass
@@ -14,7 +14,7 @@ Configuration
 =============
 
 Dependencies:
-python2.7+, nltk, lxml (optional), tkinter (optional)
+python3.4+, nltk, lxml (optional), numpy (optional), tkinter (optional)
 
 Usage
 =====
@@ -59,7 +59,9 @@ Example::
 
 
 
+import array
 import collections
+import heapq
 import re
 from functools import reduce
 
@@ -73,10 +75,17 @@ except ImportError:
 class Tag:
     '''
     General class for tags (small units of text)
+
+    (a tag is allocated for every word of a document, so the attributes are
+    kept in slots rather than in a per-instance dictionary; subclasses that
+    add attributes should declare their own __slots__ to keep it so)
     '''
 
+    __slots__ = ('string', 'stem', 'rating', 'proper', 'terminal', 'id',
+                 'id_space')
+
     def __init__(self, string, stem=None, rating=1.0, proper=False,
-                 terminal=False):
+                 terminal=False, id=None, id_space=None):
         '''
         @param string:   the actual representation of the tag
         @param stem:     the internal (usually stemmed) representation;
@@ -86,6 +95,9 @@ class Tag:
         @param terminal: set to True if the tag is at the end of a phrase
                          (or anyway it cannot be logically merged to the
                          following one)
+        @param id:       the integer id of the stem in a L{Vocabulary} (if
+                         known)
+        @param id_space: the L{Vocabulary.id_space} the id belongs to
 
         @returns: a new L{Tag} object
         '''
@@ -95,6 +107,8 @@ class Tag:
         self.rating = rating
         self.proper = proper
         self.terminal = terminal
+        self.id = id
+        self.id_space = id_space
 
     def __eq__(self, other):
         return self.stem == other.stem
@@ -114,6 +128,8 @@ class MultiTag(Tag):
     Class for aggregates of tags (usually next to each other in the document)
     '''
 
+    __slots__ = ('size', 'subratings')
+
     def __init__(self, tail, head=None):
         '''
         @param tail: the L{Tag} object to add to the first part (head)
@@ -130,6 +146,8 @@ class MultiTag(Tag):
         else:
             self.string = ' '.join([head.string, tail.string])
             self.stem = ' '.join([head.stem, tail.stem])
+            self.id = None
+            self.id_space = None
             self.size = head.size + 1
 
             self.proper = (head.proper and tail.proper)
@@ -165,6 +183,20 @@ class MultiTag(Tag):
         return product ** (1.0 / root)
 
 
+class Span:
+    '''
+    Lightweight stand-in for a L{MultiTag} while the best tags are selected
+    (see L{Rater.rate_spans})
+    '''
+
+    __slots__ = ('key', 'rating', 'string')
+
+    def __init__(self, key, rating):
+        self.key = key
+        self.rating = rating
+        self.string = None
+
+
 class Reader:
     '''
     Class for parsing a string of text to obtain tags
@@ -179,6 +211,13 @@ class Reader:
     match_paragraphs = re.compile(r'[\.\?!\t\n\r\f\v]+')
     match_phrases = re.compile(r'[,;:\(\)\[\]\{\}<>]+')
     match_words = re.compile(r'[\w\-\'_/&]+')
+    # single scanner matching words, paragraph delimiters and phrase
+    # delimiters (a subclass changing any of the patterns above should build
+    # it again in the same way); findall returns a (word, paragraph
+    # delimiter) pair for each token, both empty for phrase delimiters
+    match_tokens = re.compile('(%s)|(%s)|%s' % (match_words.pattern,
+                                                match_paragraphs.pattern,
+                                                match_phrases.pattern))
 
     def __call__(self, text):
         '''
@@ -189,48 +228,86 @@ class Reader:
 
         text = self.preprocess(text)
 
-        # split by full stops, newlines, question marks...
-        paragraphs = self.match_paragraphs.split(text)
-
+        # the text is split into paragraphs (by full stops, newlines,
+        # question marks...), phrases (by commas, colons, parentheses...)
+        # and words in a single sweep: a word is only known to be terminal
+        # when the next token is read, so it is held back until then
         tags = []
+        cleaned = {}
+        held = None
+        # whether the next word starts a paragraph (it can't be told to be a
+        # proper noun by its capital letter)
+        first = True
+
+        for word, paragraph in self.match_tokens.findall(text):
+            if word:
+                if held is not None:
+                    tags.append(held)
+                try:
+                    string = cleaned[word]
+                except KeyError:
+                    string = cleaned[word] = self.clean_word(word)
+                held = Tag(string, proper=not first and word[0].isupper())
+                first = False
+            else:
+                if held is not None:
+                    held.terminal = True
+                    tags.append(held)
+                    held = None
+                first = bool(paragraph)
 
-        for par in paragraphs:
-            # split by commas, colons, parentheses...
-            phrases = self.match_phrases.split(par)
-
-            if len(phrases) > 0:
-                # first phrase of a paragraph
-                words = self.match_words.findall(phrases[0])
-                if len(words) > 1:
-                    tags.append(Tag(self.clean_word(words[0])))
-                    for w in words[1:-1]:
-                        tags.append(Tag(self.clean_word(w), proper=w[0].isupper()))
-                    tags.append(Tag(self.clean_word(words[-1]),
-                                    proper=words[-1][0].isupper(),
-                                    terminal=True))
-                elif len(words) == 1:
-                    tags.append(Tag(self.clean_word(words[0]), terminal=True))
-
-            # following phrases
-            for phr in phrases[1:]:
-                words = self.match_words.findall(phr)
-                if len(words) > 1:
-                    for w in words[:-1]:
-
-                        tags.append(Tag(self.clean_word(w), proper=w[0].isupper()))
-                if len(words) > 0:
-                    tags.append(Tag(self.clean_word(words[-1]),
-                                    proper=words[-1][0].isupper(),
-                                    terminal=True))
+        if held is not None:
+            held.terminal = True
+            tags.append(held)
 
         return tags
 
+    def sample(self, text, size, window=2048):
+        '''
+        @param text:   the string of text to be sampled
+        @param size:   the approximate size of the sample, in characters
+        @param window: the approximate size of each piece of the sample
+
+        @returns: a sample of the text made of pieces evenly spread over it
+                  (the first one at its beginning), each starting at a line
+                  and ending at a paragraph delimiter when possible, and
+                  separated by newlines (empty if the size is not positive)
+        '''
+
+        if size <= 0:
+            return ''
+        if len(text) <= size:
+            return text
+
+        pieces = max(size // window, 1)
+        stride = len(text) // pieces
+        length = size // pieces
+        sample = []
+
+        for begin in range(0, pieces * stride, stride):
+            if begin:
+                # skip to the next line, or at least to the next word
+                line = text.find('\n', begin, begin + stride - length)
+                if line < 0:
+                    line = text.find(' ', begin, begin + stride - length)
+                if line >= 0:
+                    begin = line + 1
+            end = begin + length
+            # cut after the last paragraph delimiter in the piece, if any
+            cut = max(text.rfind('\n', begin, end), text.rfind('.', begin, end))
+            if cut > begin:
+                end = cut + 1
+            sample.append(text[begin:end])
+
+        return '\n'.join(sample)
+
     def clean_word(self, word):
         word = word.lower()
         # get rid of contractions and possessive forms
-        match = self.match_contractions.match(word)
-        if match:
-            word = match.group(1)
+        if '\'' in word:
+            match = self.match_contractions.match(word)
+            if match:
+                word = match.group(1)
 
         return word
 
@@ -256,7 +333,8 @@ class Stemmer:
 
     match_hyphens = re.compile(r'\b[\-_]\b')
 
-    def __init__(self, stemmer=None, language=None):
+    def __init__(self, stemmer=None, language=None, cache=None,
+                 vocabulary=None):
         '''
         @param stemmer: an object or module with a 'stem' method (defaults to
                         nltk.stem.snowball.SnowballStemmer)
@@ -268,16 +346,31 @@ class Stemmer:
                          norwegian porter portuguese romanian russian spanish
                          swedish]. Defaults to 'english'.
 
+        @param cache:   a L{StemCache} object memoizing the stems (it can be
+                        shared among stemmers of the same language)
+
+        @param vocabulary: a L{Vocabulary} used to assign the id of each stem
+                           to the stemmed tags (optional)
+
         @returns: a new L{Stemmer} object
         '''
 
-        if not stemmer:
+        # the default stemmer (and NLTK) is only loaded when first needed
+        self._stemmer = stemmer
+        self.language = language or "english"
+        self.cache = cache
+        self.vocabulary = vocabulary
+
+    @property
+    def stemmer(self):
+        if not self._stemmer:
             from nltk.stem.snowball import SnowballStemmer
-            if language:
-                stemmer = SnowballStemmer(language)
-            else:
-                stemmer = SnowballStemmer("english")
-        self.stemmer = stemmer
+            self._stemmer = SnowballStemmer(self.language)
+        return self._stemmer
+
+    @stemmer.setter
+    def stemmer(self, stemmer):
+        self._stemmer = stemmer
 
     def __call__(self, tag):
         '''
@@ -287,7 +380,13 @@ class Stemmer:
         '''
 
         string = self.preprocess(tag.string)
-        tag.stem = self.stemmer.stem(string)
+        if self.cache is None:
+            tag.stem = self.stemmer.stem(string)
+        else:
+            tag.stem = self.cache.stem(string, self.stemmer.stem)
+        if self.vocabulary is not None:
+            tag.id = self.vocabulary.lookup(tag.stem)
+            tag.id_space = self.vocabulary.id_space
         return tag
 
     def preprocess(self, string):
@@ -303,6 +402,114 @@ class Stemmer:
         return string
 
 
+class Vocabulary:
+    '''
+    Class for dictionaries of weights indexed by integer ids
+
+    (each stem in the dictionary is interned as an integer id, and the weights
+    are stored in a contiguous array; it can be used wherever a dictionary of
+    weights is expected, and the raters key the stems by their ids when the
+    L{Stemmer} assigned them, but the rating time is dominated by the n-grams
+    rather than by the stems, so it is about the same as with a dictionary)
+    '''
+
+    def __init__(self, weights):
+        '''
+        @param weights: a dictionary of weights normalized in the interval
+                        [0,1]
+
+        @returns: a new L{Vocabulary} object
+        '''
+
+        self.stems = sorted(weights)
+        self.ids = dict((s, i) for i, s in enumerate(self.stems))
+        self.weights = array.array('d', (weights[s] for s in self.stems))
+        # whether every stem is a single word, so that the n-grams can be
+        # keyed by the ids (see L{Rater.rate_spans})
+        self.plain = all(len(s.split()) == 1 for s in self.stems)
+
+        import hashlib
+
+        # the ids only depend on the stems: vocabularies sharing the same
+        # stems (e.g. copies sent to other processes) share the same ids,
+        # and the ids assigned with other vocabularies are not trusted
+        self.id_space = hashlib.sha1(
+            '\n'.join(self.stems).encode('utf-8')).hexdigest()
+
+    def __len__(self):
+        return len(self.stems)
+
+    def __contains__(self, stem):
+        return stem in self.ids
+
+    def __iter__(self):
+        return iter(self.stems)
+
+    def __getitem__(self, stem):
+        return self.weights[self.ids[stem]]
+
+    def get(self, stem, default=None):
+        i = self.ids.get(stem)
+        if i is None:
+            return default
+        return self.weights[i]
+
+    def items(self):
+        return zip(self.stems, self.weights)
+
+    @property
+    def fingerprint(self):
+        '''
+        A digest of the stems and of their weights (see L{ResultCache})
+        '''
+
+        import hashlib
+
+        sha = hashlib.sha1(self.id_space.encode('ascii'))
+        sha.update(self.weights.tobytes())
+
+        return sha.hexdigest()
+
+    def lookup(self, stem):
+        '''
+        @param stem: the stem to be looked up
+
+        @returns: the id of the stem, or -1 if it is not in the vocabulary
+        '''
+
+        return self.ids.get(stem, -1)
+
+    def encode(self, tags, unknown=None):
+        '''
+        @param tags:    a list of tags, possibly with ids already assigned by
+                        the L{Stemmer} (they are only used if they belong to
+                        the id space of this vocabulary)
+        @param unknown: a dictionary where the ids given to the stems missing
+                        from the vocabulary are stored (optional)
+
+        @returns: the list of ids of the tags (stems missing from the
+                  vocabulary get ids past its end, private to this call)
+        '''
+
+        ids = self.ids
+        if unknown is None:
+            unknown = {}
+        space = self.id_space
+        encoded = [t.id if t.id_space == space else None for t in tags]
+
+        # only the tags without a known id are looked up by their stem
+        if None in encoded or -1 in encoded:
+            for position in [p for p, i in enumerate(encoded)
+                             if i is None or i < 0]:
+                stem = tags[position].stem
+                i = ids.get(stem, -1)
+                if i < 0:
+                    i = unknown.setdefault(stem, len(ids) + len(unknown))
+                encoded[position] = i
+
+        return encoded
+
+
 class Rater:
     '''
     Class for estimating the relevance of tags
@@ -315,7 +522,7 @@ class Rater:
     def __init__(self, weights, multitag_size=3):
         '''
         @param weights:       a dictionary of weights normalized in the
-                              interval [0,1]
+                              interval [0,1] (or a L{Vocabulary})
         @param multitag_size: maximum size of tags formed by multiple unit
                               tags
 
@@ -325,14 +532,31 @@ class Rater:
         self.weights = weights
         self.multitag_size = multitag_size
 
-    def __call__(self, tags):
+    def __call__(self, tags, k=None, stats=None):
         '''
-        @param tags: a list of (preferably stemmed) tags
+        @param tags:  a list of (preferably stemmed) tags
+        @param k:     if given, only the k best tags are returned (subclasses
+                      overriding this method may leave it out, and the
+                      stats too: L{Tagger} only passes the arguments that
+                      the override accepts)
+        @param stats: if given, a dictionary where the number of 'multitags',
+                      unique 'candidates' and redundant tags 'pruned' are
+                      stored, as well as the number of n-grams of stopwords
+                      'avoided' without being generated (L{Tagger} passes it
+                      when instrumented)
 
         @returns: a list of unique (multi)tags sorted by relevance
         '''
 
         self.rate_tags(tags)
+
+        if (type(self).create_multitags is Rater.create_multitags and
+                type(self).remove_redundant is Rater.remove_redundant):
+            # same results, without building a multitag for each n-gram
+            result = self.rate_spans(tags, k, stats)
+            if result is not None:
+                return result
+
         multitags = self.create_multitags(tags)
 
         # keep most frequent version of each tag
@@ -349,41 +573,389 @@ class Rater:
         term_count = Counter(multitags)
 
         for t, cnt in term_count.items():
-            t.string = clusters[t].most_common(1)[0][0]
             proper_freq = proper[t] / cnt
             if proper_freq >= 0.5:
                 t.proper = True
                 t.rating = ratings[t]
 
-        # purge duplicates, one-character tags and stopwords
-        unique_tags = set(t for t in term_count
-                          if len(t.string) > 1 and t.rating > 0.0)
+        # purge duplicates and stopwords
+        unique_tags = set(t for t in term_count if t.rating > 0.0)
+
+        if stats is not None:
+            stats['multitags'] = len(multitags)
+            stats['avoided'] = 0
+            stats['candidates'] = len(unique_tags)
+
+        self.remove_redundant(term_count, unique_tags)
+
+        if stats is not None:
+            stats['pruned'] = stats['candidates'] - len(unique_tags)
+
+        def accept(t):
+            # the most frequent version is only looked up for the tags that
+            # can make it to the results, and one-character tags are purged
+            t.string = clusters[t].most_common(1)[0][0]
+            return len(t.string) > 1
+
+        return self.select([t for t in term_count if t in unique_tags], k,
+                           accept)
+
+    def rate_spans(self, tags, k=None, stats=None):
+        '''
+        Rates the n-grams of the tags like L{__call__} does with the
+        multitags built by L{create_multitags}, but each n-gram is only
+        represented by an integer key (its stem ids in mixed radix) and the
+        position of its first occurrence, and the L{MultiTag} objects are
+        only built for the n-grams that make it to the results
+
+        @param tags:  a list of rated tags
+        @param k:     if given, only the k best tags are returned
+        @param stats: if given, a dictionary where the counters are stored
+
+        @returns: a list of unique (multi)tags sorted by relevance, or None if
+                  the stems or the strings of the tags can't be keyed (i.e.
+                  they are empty or contain whitespace)
+        '''
+
+        vocabulary = self.weights
+        if isinstance(vocabulary, Vocabulary) and vocabulary.plain:
+            # the stems are keyed by their ids in the vocabulary (as assigned
+            # by the Stemmer), so only the stems missing from it are hashed
+            stem_index = {}
+            stem_ids = [i + 1 for i in vocabulary.encode(tags, stem_index)]
+            stem_radix = len(vocabulary) + len(stem_index) + 1
+        else:
+            stem_index = {}
+            stem_ids = [stem_index.setdefault(t.stem, len(stem_index) + 1)
+                        for t in tags]
+            stem_radix = len(stem_index) + 1
+        string_index = {}
+        string_ids = [string_index.setdefault(t.string, len(string_index) + 1)
+                      for t in tags]
+
+        # multitags are told apart (and split) by the spaces between words
+        if (any(len(stem.split()) != 1 for stem in stem_index) or
+                any(' ' in string for string in string_index)):
+            return None
+
+        n = len(tags)
+        size = max(self.multitag_size, 1)
+        ratings = [t.rating for t in tags]
+        string_radix = len(string_index) + 1
+
+        # the digits of the keys are never 0, so n-grams of different sizes
+        # get different keys too
+        count = {}
+        first = {}
+        rating = {}
+        spelling = {}
+        variants = {}
+        proper_count = {}
+        proper_rating = {}
+        first_proper = set()
+
+        # an n-gram containing a stem that is always rated 0 (a stopword) and
+        # never a proper noun is rated 0 (the exception for proper nouns can't
+        # apply) and can't make any other n-gram redundant, and neither can
+        # the longer n-grams containing it: they are not generated at all
+        barren = [True] * stem_radix
+        for t, i in zip(tags, stem_ids):
+            if t.rating != 0.0 or t.proper:
+                barren[i] = False
+        avoided = 0
+
+        for i in range(n):
+            key = string_key = 0
+            product = 1.0
+            proper = True
+
+            for j in range(i, min(i + size, n)):
+                t = tags[j]
+                if barren[stem_ids[j]]:
+                    # count the n-grams that would have been generated
+                    for t in tags[j:min(i + size, n)]:
+                        avoided += 1
+                        if t.terminal:
+                            break
+                    break
+
+                key = key * stem_radix + stem_ids[j]
+                string_key = string_key * string_radix + string_ids[j]
+                product *= ratings[j]
+                proper = proper and t.proper
+
+                c = count.get(key)
+                if c is None:
+                    count[key] = 1
+                    first[key] = i * size + j - i
+                    spelling[key] = string_key
+                    rating[key] = r = self.span_rating(ratings, i, j + 1,
+                                                       product, proper)
+                    if proper:
+                        first_proper.add(key)
+                else:
+                    count[key] = c + 1
+                    # the spellings of each n-gram are only counted once it
+                    # has more than one
+                    spelled = variants.get(key)
+                    if spelled is not None:
+                        variant = spelled.get(string_key)
+                        if variant is None:
+                            spelled[string_key] = [1, i]
+                        else:
+                            variant[0] += 1
+                    elif string_key != spelling[key]:
+                        variants[key] = {spelling[key]: [c, first[key] // size],
+                                         string_key: [1, i]}
+                    if proper:
+                        r = self.span_rating(ratings, i, j + 1, product, proper)
+
+                if proper:
+                    proper_count[key] = proper_count.get(key, 0) + 1
+                    if r > proper_rating.get(key, 0.0):
+                        proper_rating[key] = r
+
+                if t.terminal:
+                    break
+
+        # the n-grams that are mostly proper nouns take the best rating of
+        # their proper occurrences
+        propers = first_proper
+        for key, p in proper_count.items():
+            if p / count[key] >= 0.5:
+                propers.add(key)
+                rating[key] = proper_rating.get(key, 0.0)
+
+        candidates = [key for key in count if rating[key] > 0.0]
+
+        if stats is not None:
+            stats['multitags'] = sum(count.values())
+            stats['avoided'] = avoided
+            stats['candidates'] = len(candidates)
+
+        # discard either an n-gram or its parts, depending on their relative
+        # frequency (see remove_redundant)
+        redundant = set()
+
+        for key, cnt in count.items():
+            start, length = divmod(first[key], size)
+            length += 1
+            if length < 2:
+                continue
+            proper = key in propers
+            rated = rating[key] > 0.0
+            for i in range(length):
+                sub = 0
+                # the whole n-gram is not a part of itself
+                for j in range(i, length - 1 if i == 0 else length):
+                    sub = sub * stem_radix + stem_ids[start + j]
+                    relative_freq = cnt / count[sub]
+                    if ((relative_freq == 1.0 and proper) or
+                        (relative_freq >= 0.5 and rated)):
+                        redundant.add(sub)
+                    else:
+                        redundant.add(key)
+
+        candidates = [key for key in candidates if key not in redundant]
+
+        if stats is not None:
+            stats['pruned'] = stats['candidates'] - len(candidates)
+
+        def string(key):
+            # the most frequent spelling, the earliest one in case of ties
+            start, length = divmod(first[key], size)
+            spelled = variants.get(key)
+            if spelled is not None:
+                start = max(spelled.values(), key=lambda v: v[0])[1]
+            return ' '.join(t.string for t in tags[start:start + length + 1])
+
+        def accept(span):
+            span.string = string(span.key)
+            return len(span.string) > 1
+
+        selected = self.select([Span(key, rating[key]) for key in candidates],
+                               k, accept)
+
+        # the multitags are only built for the selected n-grams
+        result = []
+
+        for span in selected:
+            start, length = divmod(first[span.key], size)
+            t = MultiTag(tags[start])
+            for j in range(start + 1, start + length + 1):
+                t = MultiTag(tags[j], t)
+            t.string = span.string
+            if proper_count.get(span.key, 0) / count[span.key] >= 0.5:
+                t.proper = True
+                t.rating = span.rating
+            result.append(t)
+
+        return result
+
+    def span_rating(self, ratings, start, end, product, proper):
+        '''
+        @param ratings: the ratings of the tags
+        @param start:   the position of the first tag of an n-gram
+        @param end:     the position after its last tag
+        @param product: the product of the ratings of its tags
+        @param proper:  whether all its tags are proper nouns
+
+        @returns: the rating of the n-gram, as computed by
+                  L{MultiTag.combined_rating}
+        '''
+
+        size = end - start
+        if size == 1:
+            return ratings[start]
+
+        # but proper nouns shouldn't be penalized by stopwords
+        if product == 0.0 and proper:
+            nonzero = [r for r in ratings[start:end] if r > 0.0]
+            if len(nonzero) == 0:
+                return 0.0
+            product = reduce(lambda x, y: x * y, nonzero, 1.0)
+            size = len(nonzero)
+
+        return product ** (1.0 / size)
+
+    def remove_redundant(self, term_count, unique_tags):
+        '''
+        Discards either a multitag or its parts, depending on their relative
+        frequency
+
+        @param term_count:  a dictionary with the count of each (multi)tag
+        @param unique_tags: the set of candidate tags, modified in place
+        '''
+
+        # index the multitags in a trie of stems, so that the count of every
+        # part of a multitag is found by walking it instead of building and
+        # hashing a new tag for each part; each node is a list
+        # [count, children, tag, redundant]
+        trie = {}
+        entries = []
 
-        # remove redundant tags
         for t, cnt in term_count.items():
             words = t.stem.split()
-            for l in range(1, len(words)):
-                for i in range(len(words) - l + 1):
-                    s = Tag(' '.join(words[i:i + l]))
-                    relative_freq = cnt / term_count[s]
+            children = trie
+            for w in words:
+                node = children.get(w)
+                if node is None:
+                    node = children[w] = [0, {}, None, False]
+                children = node[1]
+            node[0] = cnt
+            node[2] = t
+            entries.append((t, cnt, words, node))
+
+        for t, cnt, words, own in entries:
+            size = len(words)
+            if size < 2:
+                continue
+            for i in range(size):
+                children = trie
+                # the whole multitag is not a part of itself
+                for j in range(i, size - 1 if i == 0 else size):
+                    node = children[words[j]]
+                    children = node[1]
+                    relative_freq = cnt / node[0]
                     if ((relative_freq == 1.0 and t.proper) or
                         (relative_freq >= 0.5 and t.rating > 0.0)):
-                        unique_tags.discard(s)
+                        node[3] = True
                     else:
-                        unique_tags.discard(t)
+                        own[3] = True
 
-        return sorted(unique_tags)
+        unique_tags.difference_update([t for t, cnt, words, node in entries
+                                       if node[3]])
+
+    def select(self, candidates, k=None, accept=None):
+        '''
+        @param candidates: a list of rated tags, in order of first occurrence
+        @param k:          number of tags to be selected (all of them if None)
+        @param accept:     a function telling whether a candidate can be
+                           selected; it is only called on the candidates
+                           rated high enough to enter the top k
+
+        @returns: the best candidates sorted by rating (ties are broken by
+                  order of first occurrence)
+        '''
+
+        if k is None:
+            best = [t for t in candidates if accept is None or accept(t)]
+            best.sort(key=lambda t: -t.rating)
+            return best
+
+        if k <= 0:
+            return []
+
+        # bounded min-heap of the best candidates so far; on equal ratings
+        # the later candidate is the worse one
+        heap = []
+
+        for position, t in enumerate(candidates):
+            if len(heap) == k and t.rating <= heap[0][0]:
+                continue
+            if accept is not None and not accept(t):
+                continue
+            entry = (t.rating, -position, t)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            else:
+                heapq.heapreplace(heap, entry)
+
+        heap.sort(reverse=True)
+
+        return [t for rating, position, t in heap]
+
+    def rate_unigrams(self, tags, k=None, stats=None):
+        '''
+        Rates single words only, without building any multitag (this is what
+        L{NaiveRater} does, and what L{Tagger.tag_within} falls back to when
+        the budget is tight)
+
+        @param tags:  a list of (preferably stemmed) tags
+        @param k:     if given, only the k best tags are returned
+        @param stats: if given, a dictionary where the counters are stored
+                      (see L{Rater.__call__})
+
+        @returns: a list of unique tags sorted by relevance
+        '''
+
+        self.rate_tags(tags)
+        # we still get rid of one-character tags and stopwords (keeping the
+        # first occurrence of each tag)
+        unique_tags = dict.fromkeys(t for t in tags
+                                    if len(t.string) > 1 and t.rating > 0.0)
+        if stats is not None:
+            stats['multitags'] = len(tags)
+            stats['avoided'] = 0
+            stats['candidates'] = len(unique_tags)
+            stats['pruned'] = 0
+        return self.select(list(unique_tags), k)
 
     def rate_tags(self, tags):
         '''
         @param tags: a list of tags to be assigned a rating
         '''
 
+        if isinstance(self.weights, Vocabulary):
+            # count and weigh integer ids instead of hashing the stems again
+            ids = self.weights.encode(tags)
+            weights = self.weights.weights
+            size = len(weights)
+            term_count = Counter(ids)
+
+            for t, i in zip(tags, ids):
+                t.rating = 1.0 * term_count[i] / len(tags) * (weights[i] if i < size else 1.0)
+            return
+
         term_count = Counter(tags)
 
+        # rating of a single tag is term frequency * weight (the weights are
+        # looked up once per distinct stem)
+        ratings = dict((t, 1.0 * cnt / len(tags) * self.weights.get(t.stem, 1.0))
+                       for t, cnt in term_count.items())
+
         for t in tags:
-            # rating of a single tag is term frequency * weight
-            t.rating = 1.0 * term_count[t] / len(tags) * self.weights.get(t.stem, 1.0)
+            t.rating = ratings[t]
 
     def create_multitags(self, tags):
         '''
@@ -407,19 +979,58 @@ class Rater:
         return multitags
 
 
+def _rater_arguments(rater):
+    '''
+    @param rater: a L{Rater} object (or any callable rating a list of tags)
+
+    @returns: how many of the arguments (tags, k, stats) of
+              L{Rater.__call__} it accepts
+    '''
+
+    import inspect
+
+    try:
+        signature = inspect.signature(rater)
+    except (TypeError, ValueError):
+        return 1
+
+    for number in (3, 2):
+        try:
+            signature.bind(*range(number))
+        except TypeError:
+            continue
+        return number
+
+    return 1
+
+
 class Tagger:
     '''
     Master class for tagging text documents
 
     (this is a simple interface that should allow convenient experimentation
     by using different classes as building blocks)
+
+    A tagger keeps no state between calls, so one tagger can be shared by
+    many threads, provided its building blocks can too: the readers,
+    stemmers and raters in this package only use local state while tagging,
+    and the caches and sinks in this package take locks around their
+    updates.
     '''
 
-    def __init__(self, reader, stemmer, rater):
+    def __init__(self, reader, stemmer, rater, instrument=None, cache=None,
+                 dedup=None):
         '''
         @param reader: a L{Reader} object
         @param stemmer: a L{Stemmer} object
         @param rater: a L{Rater} object
+        @param instrument: an L{Instrument} object recording the timings and
+                           counters of each document (optional)
+        @param cache: a L{ResultCache} object memoizing the tags of each
+                      document (optional)
+        @param dedup: a L{DuplicateIndex} object reusing the tags of
+                      near-duplicate documents instead of rating them
+                      (optional)
 
         @returns: a new L{Tagger} object
         '''
@@ -427,6 +1038,15 @@ class Tagger:
         self.reader = reader
         self.stemmer = stemmer
         self.rater = rater
+        # the last rater seen and how many arguments it accepts (see
+        # rater_arguments)
+        self._rater_arity = None
+        # the last rater timed by tag_within and its relative cost (see
+        # measured_rater_cost)
+        self._rater_cost = None
+        self.instrument = instrument
+        self.cache = cache
+        self.dedup = dedup
 
     def __call__(self, text, tags_number=5):
         '''
@@ -436,11 +1056,353 @@ class Tagger:
         Returns: a list of (hopefully) relevant tags
         '''
 
+        if self.cache is not None:
+            return self.cached_call(text, tags_number)
+        if self.instrument is not None:
+            return self.instrumented_call(text, tags_number)
+
+        return self.run(text, tags_number)
+
+    def rater_arguments(self):
+        '''
+        @returns: how many of the arguments (tags, k, stats) of
+                  L{Rater.__call__} the rater accepts, since raters written
+                  for earlier versions only take the tags (it is worked out
+                  again whenever the rater is replaced)
+        '''
+
+        rater = self.rater
+        arity = getattr(self, '_rater_arity', None)
+        if arity is None or arity[0] is not rater:
+            # a single assignment, so that threads never see a rater paired
+            # with the arity of another one
+            arity = self._rater_arity = (rater, _rater_arguments(rater))
+
+        return arity[1]
+
+    def run(self, text, tags_number=5):
+        '''
+        Runs the whole pipeline on the text, bypassing the cache and the
+        instrument
+
+        @param text:        the string of text to be tagged
+        @param tags_number: number of best tags to be returned
+
+        Returns: a list of (hopefully) relevant tags
+        '''
+
         tags = self.reader(text)
         tags = list(map(self.stemmer, tags))
-        tags = self.rater(tags)
 
-        return tags[:tags_number]
+        return self.rate(tags, tags_number)
+
+    def rate(self, tags, tags_number=5, stats=None):
+        '''
+        Runs the rater, unless the tags of a near-duplicate document are found
+        in the index
+
+        @param tags:        a list of stemmed tags
+        @param tags_number: number of best tags to be returned
+        @param stats:       if given, a dictionary where the counters of the
+                            rater are stored (see L{Rater.__call__})
+
+        Returns: a list of (hopefully) relevant tags
+        '''
+
+        dedup = self.dedup
+        if dedup is not None:
+            signature = dedup.signature(tags)
+            found = dedup.get(signature, tags_number)
+            if stats is not None:
+                stats['reused'] = int(found is not None)
+            if found is not None:
+                return found
+
+        arguments = self.rater_arguments()
+        tags = self.rater(*(tags, tags_number, stats)[:arguments])
+        tags = tags[:tags_number]
+
+        if dedup is not None:
+            dedup.put(signature, tags_number, tags)
+
+        return tags
+
+    # cost of the rater relative to that of the reader and the stemmer on
+    # the same tokens, when rating multitags, until tag_within has measured
+    # it (as measured by benchmarks/bench_latency.py, with some margin)
+    rater_cost = 0.5
+    # number of characters read (and stemmed) to estimate the cost of a
+    # long document in L{Tagger.tag_within}
+    probe_size = 4096
+    # share of the time budget kept for rating after stemming
+    rating_reserve = 0.2
+
+    def tag_within(self, text, tags_number=5, seconds=None, tokens=None):
+        '''
+        Tags the text within a latency budget, degrading in steps when the
+        budget is tight; the degradation level is one of:
+
+          - 'full': the whole text was tagged as usual
+          - 'sampled': only a sample of paragraphs evenly spread over the text
+            (see L{Reader.sample}) was tagged
+          - 'unigrams': only single words were rated, as by the
+            L{NaiveRater}, because rating multitags would have taken too
+            long
+          - 'partial': the time ran out while stemming, and the words
+            stemmed so far were rated as single words (on a long text, if
+            no more than the probe used to estimate the costs fits in the
+            budget, only the words of the probe are rated)
+
+        (the cache, the index of near-duplicates and the instrument are
+        bypassed; the cost of stemming is estimated on the document itself,
+        and the cost of rating multitags is learned from the previous calls
+        that rated them (see L{Tagger.measured_rater_cost}), so the tagger
+        should be warmed up by a few calls; no budget can be met below the
+        cost of reading the probe)
+
+        @param text:        the string of text to be tagged
+        @param tags_number: number of best tags to be returned
+        @param seconds:     the time budget, in seconds (optional)
+        @param tokens:      the maximum number of tokens to be read
+                            (optional)
+
+        Returns: a pair (list of tags, degradation level)
+        '''
+
+        from time import perf_counter
+
+        start = perf_counter()
+        level = 'full'
+        stemmed = None
+
+        if seconds:
+            # the stemmer stops in time to leave a reserve for the rater
+            deadline = start + seconds
+            cutoff = deadline - self.rating_reserve * seconds
+
+        # the cost of each character is estimated on the beginning of a long
+        # text, to know how much of it fits in the budget
+        if (seconds or tokens) and len(text) > self.probe_size:
+            probe = self.reader(text[:self.probe_size])
+            count = max(len(probe), 1)
+            limit = tokens or float('inf')
+            if seconds:
+                stemmed = self.stem_until(probe, cutoff)
+                elapsed = perf_counter() - start
+                per_token = elapsed / count * (1 + self.measured_rater_cost())
+                limit = min(limit, (seconds - elapsed) / per_token)
+            size = max(int(limit * self.probe_size / count), 0)
+            if seconds and size <= self.probe_size:
+                # no more than the probe fits in the budget (or not even the
+                # probe did): the words of the probe stemmed so far are rated
+                # instead of reading and stemming a sample
+                level = 'partial'
+            elif size < len(text):
+                text = self.reader.sample(text, size)
+                level = 'sampled'
+
+        if level == 'partial':
+            tags = stemmed
+            stemming = 0.0
+        else:
+            tags = self.reader(text)
+            if tokens and len(tags) > tokens:
+                tags = tags[:tokens]
+                level = 'sampled'
+
+            if seconds:
+                started = perf_counter()
+                stemmed = self.stem_until(tags, cutoff)
+                if len(stemmed) < len(tags):
+                    level = 'partial'
+                tags = stemmed
+                stemming = perf_counter() - started
+            else:
+                tags = list(map(self.stemmer, tags))
+
+        rater = self.rater
+        if isinstance(rater, Rater):
+            if level == 'partial' or (seconds and perf_counter() + stemming *
+                                      self.measured_rater_cost() > deadline):
+                if level != 'partial':
+                    level = 'unigrams'
+                return rater.rate_unigrams(tags, tags_number), level
+        arguments = self.rater_arguments()
+        if seconds and level != 'partial':
+            started = perf_counter()
+            tags = rater(*(tags, tags_number)[:arguments])
+            self.learn_rater_cost(perf_counter() - started, stemming)
+        else:
+            tags = rater(*(tags, tags_number)[:arguments])
+
+        return tags[:tags_number], level
+
+    def measured_rater_cost(self):
+        '''
+        @returns: the cost of the rater relative to that of the reader and
+                  the stemmer, as measured by the last calls of
+                  L{Tagger.tag_within} that rated multitags (or
+                  L{Tagger.rater_cost}, before any such call)
+        '''
+
+        measured = getattr(self, '_rater_cost', None)
+        if measured is None or measured[0] is not self.rater:
+            return self.rater_cost
+
+        return measured[1]
+
+    def learn_rater_cost(self, rating, stemming):
+        '''
+        Updates the cost of the rater relative to that of the stemmer (a
+        moving average, so that a single slow call doesn't make every
+        following one degrade)
+
+        @param rating:   seconds spent rating the tags
+        @param stemming: seconds spent stemming the same tags
+        '''
+
+        if stemming <= 0.0:
+            return
+        cost = rating / stemming
+        measured = getattr(self, '_rater_cost', None)
+        if measured is not None and measured[0] is self.rater:
+            cost = 0.75 * measured[1] + 0.25 * cost
+        # a single assignment, as for the arity of the rater
+        self._rater_cost = (self.rater, cost)
+
+    def stem_until(self, tags, cutoff, step=32):
+        '''
+        @param tags:   a list of tags to be stemmed
+        @param cutoff: the value of time.perf_counter() after which no more
+                       tags are stemmed
+        @param step:   number of tags stemmed between two looks at the clock
+
+        @returns: the list of the tags stemmed before the cutoff, in order
+        '''
+
+        from time import perf_counter
+
+        stemmer = self.stemmer
+        stemmed = []
+
+        for i in range(0, len(tags), step):
+            if perf_counter() > cutoff:
+                break
+            stemmed.extend(map(stemmer, tags[i:i + step]))
+
+        return stemmed
+
+    def cached_call(self, text, tags_number=5):
+        '''
+        Same as calling the tagger, but the tags are looked up in the cache
+        first (and stored into it if missing)
+
+        @param text:        the string of text to be tagged
+        @param tags_number: number of best tags to be returned
+
+        Returns: a list of (hopefully) relevant tags
+        '''
+
+        cache = self.cache
+        key = cache.key(self, text, tags_number)
+        tags = cache.get(key)
+
+        if tags is None:
+            if self.instrument is not None:
+                tags = self.instrumented_call(text, tags_number)
+            else:
+                tags = self.run(text, tags_number)
+            cache.put(key, tags)
+
+        return tags
+
+    def instrumented_call(self, text, tags_number=5):
+        '''
+        Same as calling the tagger, but the wall time of each stage and the
+        counters of the document are passed to the instrument
+
+        @param text:        the string of text to be tagged
+        @param tags_number: number of best tags to be returned
+
+        Returns: a list of (hopefully) relevant tags
+        '''
+
+        from time import perf_counter
+
+        record = {}
+        start = perf_counter()
+
+        tags = self.reader(text)
+        read = perf_counter()
+        tags = list(map(self.stemmer, tags))
+        stemmed = perf_counter()
+        record['tokens'] = len(tags)
+        tags = self.rate(tags, tags_number, record)
+        end = perf_counter()
+
+        record['tags'] = len(tags)
+        record['reader'] = read - start
+        record['stemmer'] = stemmed - read
+        record['rater'] = end - stemmed
+        record['total'] = end - start
+        self.instrument.record(record)
+
+        return tags
+
+    def tag_many(self, texts, tags_number=5, workers=None, chunksize=16,
+                 ordered=True, threads=False):
+        '''
+        @param texts:       an iterable of strings of text to be tagged (it is
+                            consumed lazily, as the workers need more input)
+        @param tags_number: number of best tags to be returned for each text
+        @param workers:     number of worker processes (defaults to the number
+                            of CPUs; 1 tags the texts in this process)
+        @param chunksize:   number of texts sent to a worker at once
+        @param ordered:     if False, (index, tags) pairs are returned as soon
+                            as they are ready instead of following the input
+                            order
+        @param threads:     if True, the workers are threads sharing this
+                            tagger (and its caches and instrument) instead of
+                            processes; this scales with the cores on a
+                            free-threaded build of Python
+
+        Returns: an iterator over the lists of tags of each text
+        '''
+
+        if threads and workers != 1:
+            from . import parallel
+
+            if ordered:
+                def function(texts, tags_number):
+                    return [self(text, tags_number) for text in texts]
+                items = texts
+            else:
+                def function(items, tags_number):
+                    return [(i, self(text, tags_number)) for i, text in items]
+                items = enumerate(texts)
+
+            return parallel.imap(function, items, (tags_number,),
+                                 workers=workers, chunksize=chunksize,
+                                 ordered=ordered, threads=True)
+
+        if workers == 1:
+            if ordered:
+                return (self(text, tags_number) for text in texts)
+            return ((i, self(text, tags_number))
+                    for i, text in enumerate(texts))
+
+        from . import parallel
+
+        if ordered:
+            function, items = parallel.tag_chunk, texts
+        else:
+            function, items = parallel.tag_indexed_chunk, enumerate(texts)
+
+        # the tagger is sent once to each worker, not once per task
+        return parallel.imap(function, items, (tags_number,), workers=workers,
+                             chunksize=chunksize, ordered=ordered,
+                             initializer=parallel.init_tagger,
+                             initargs=(self,))
 
 
 
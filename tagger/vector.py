@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+
+'''
+Rater implementation vectorized with NumPy, for long documents
+
+Dependencies:
+numpy
+'''
+
+import heapq
+
+import numpy
+
+from .tagger import Rater, Tag, Vocabulary
+
+
+class VectorRater(Rater):
+    '''
+    Rater subclass that computes the same ratings and rankings as L{Rater},
+    but works on arrays of ids instead of building a L{MultiTag} for every
+    n-gram in the document
+
+    (ties in the ranking are broken by the position of the first occurrence,
+    so the results are deterministic)
+    '''
+
+    def __call__(self, tags, k=None, stats=None):
+        '''
+        @param tags:  a list of (preferably stemmed) tags
+        @param k:     if given, only the k best tags are returned
+        @param stats: if given, a dictionary where the counters are stored
+                      (see L{Rater.__call__})
+
+        @returns: a list of unique (multi)tags sorted by relevance
+        '''
+
+        n = len(tags)
+        if n == 0:
+            if stats is not None:
+                stats.update(multitags=0, avoided=0, candidates=0, pruned=0)
+            return []
+
+        if isinstance(self.weights, Vocabulary):
+            stem_ids, stems = self.intern_ids(tags)
+        else:
+            stem_ids, stems = self.intern(t.stem for t in tags)
+        string_ids, strings = self.intern(t.string for t in tags)
+        proper = numpy.fromiter((t.proper for t in tags), bool, n)
+        terminal = numpy.fromiter((t.terminal for t in tags), bool, n)
+
+        ratings = self.rate_ids(stem_ids, stems)
+
+        # prefix sums, to tell in O(1) whether a window contains a terminal
+        # tag (before its last position) or only proper nouns
+        terminals_before = numpy.concatenate(([0], numpy.cumsum(terminal)))
+        propers_before = numpy.concatenate(([0], numpy.cumsum(proper)))
+        nonzero = ratings > 0.0
+        nonzero_before = numpy.concatenate(([0], numpy.cumsum(nonzero)))
+        nonzero_ratings = numpy.where(nonzero, ratings, 1.0)
+
+        levels = []
+        stem_keys = stem_ids
+        string_keys = string_ids
+
+        for size in range(1, min(self.multitag_size, n) + 1):
+            count = n - size + 1
+            starts = numpy.arange(count)
+            ends = starts + size
+
+            if size > 1:
+                # the key of an n-gram is derived from the key of its head
+                # and the id of its tail
+                stem_keys = self.dense(stem_keys[:count] * len(stems) +
+                                       stem_ids[size - 1:])
+                string_keys = self.dense(string_keys[:count] * len(strings) +
+                                         string_ids[size - 1:])
+
+            valid = (terminals_before[ends - 1] - terminals_before[starts]) == 0
+            all_proper = (propers_before[ends] - propers_before[starts]) == size
+
+            # geometric mean, multiplying in the same order as
+            # MultiTag.combined_rating so that the results are identical
+            product = ratings[:count].copy()
+            nonzero_product = nonzero_ratings[:count].copy()
+            for j in range(1, size):
+                product *= ratings[j:j + count]
+                nonzero_product *= nonzero_ratings[j:j + count]
+            rating = product ** (1.0 / size)
+
+            # but proper nouns shouldn't be penalized by stopwords
+            roots = nonzero_before[ends] - nonzero_before[starts]
+            special = all_proper & (product == 0.0) & (size > 1)
+            if special.any():
+                rating[special] = numpy.where(
+                    roots[special] > 0,
+                    nonzero_product[special] **
+                    (1.0 / numpy.maximum(roots[special], 1)),
+                    0.0)
+
+            level = self.cluster(size, stem_keys, string_keys, valid,
+                                 all_proper, rating)
+            level['product'] = product
+            level['nonzero_product'] = nonzero_product
+            level['roots'] = roots
+            levels.append(level)
+
+        if stats is not None:
+            stats['multitags'] = sum(int(level['count'].sum())
+                                     for level in levels)
+            stats['avoided'] = 0
+            rated = [level['present'] & (level['rating'] > 0.0)
+                     for level in levels]
+            stats['candidates'] = sum(int(numpy.count_nonzero(r))
+                                      for r in rated)
+
+        # discard redundant n-grams and stopwords
+        kept = self.prune(levels)
+
+        if stats is not None:
+            stats['pruned'] = sum(int(numpy.count_nonzero(r & ~keep))
+                                  for r, keep in zip(rated, kept))
+
+        # purge one-character tags
+        string_lengths = numpy.array([len(s) for s in strings])
+        kept[0] &= string_lengths[string_ids[levels[0]['string']]] > 1
+
+        candidates = []
+
+        for level, keep in zip(levels, kept):
+            for g in numpy.flatnonzero(keep):
+                candidates.append((-self.exact_rating(level, g),
+                                   level['start'][g], level['size'], level, g))
+
+        if k is None:
+            candidates.sort(key=lambda c: c[:3])
+        else:
+            candidates = heapq.nsmallest(k, candidates, key=lambda c: c[:3])
+
+        # strings are only built for the selected tags
+        result = []
+
+        for rating, start, size, level, g in candidates:
+            first = level['string'][g]
+            string = ' '.join(strings[i] for i in string_ids[first:first + size])
+            stem = ' '.join(stems[i] for i in stem_ids[start:start + size])
+            result.append(Tag(string, stem, -rating, bool(level['proper'][g])))
+
+        return result
+
+    def exact_rating(self, level, g):
+        '''
+        @param level: the n-grams of a given size, as returned by L{cluster}
+        @param g:     the id of an n-gram
+
+        @returns: the rating of the n-gram computed with Python floats, as
+                  NumPy's power may differ from it in the last bit
+        '''
+
+        # all the occurrences of an n-gram share the same unit ratings, so
+        # its rating only depends on whether the proper noun rule applies
+        start = level['start'][g]
+        size = level['size']
+        if size > 1 and level['proper'][g] and level['product'][start] == 0.0:
+            roots = int(level['roots'][start])
+            if roots == 0:
+                return 0.0
+            return float(level['nonzero_product'][start]) ** (1.0 / roots)
+        return float(level['product'][start]) ** (1.0 / size)
+
+    def intern(self, values):
+        '''
+        @param values: an iterable of hashable values
+
+        @returns: an array with the id of each value and the list of distinct
+                  values (indexed by id)
+        '''
+
+        index = {}
+        ids = numpy.fromiter((index.setdefault(v, len(index)) for v in values),
+                             numpy.int64)
+        return ids, list(index)
+
+    def intern_ids(self, tags):
+        '''
+        Same as L{intern} on the stems of the tags, but the stems are keyed
+        by their ids in the L{Vocabulary} (as assigned by the L{Stemmer}), so
+        only the stems missing from it are hashed
+
+        @param tags: a list of tags
+
+        @returns: an array with the id of the stem of each tag (numbered in
+                  the order of the vocabulary) and the list of distinct stems
+                  (indexed by id)
+        '''
+
+        vocabulary = self.weights
+        unknown = {}
+        ids = numpy.array(vocabulary.encode(tags, unknown), numpy.int64)
+        found, ids = numpy.unique(ids, return_inverse=True)
+
+        names = vocabulary.stems + list(unknown)
+        return ids.reshape(-1), [names[i] for i in found.tolist()]
+
+    def dense(self, keys):
+        '''
+        @param keys: an array of integer keys
+
+        @returns: the keys renumbered as consecutive ids starting from 0
+        '''
+
+        return numpy.unique(keys, return_inverse=True)[1].reshape(-1)
+
+    def rate_ids(self, stem_ids, stems):
+        '''
+        @param stem_ids: the array of stem ids of the tags
+        @param stems:    the list of distinct stems, indexed by id
+
+        @returns: the array of ratings of the tags (term frequency * weight)
+        '''
+
+        term_count = numpy.bincount(stem_ids, minlength=len(stems))
+        weights = numpy.array([self.weights.get(s, 1.0) for s in stems],
+                              dtype=float)
+        return 1.0 * term_count[stem_ids] / len(stem_ids) * weights[stem_ids]
+
+    def cluster(self, size, stem_keys, string_keys, valid, all_proper,
+                rating):
+        '''
+        Groups together the occurrences of each n-gram of the given size,
+        keeping the most frequent version of each one
+
+        @returns: a dictionary of arrays indexed by n-gram id ('keys' gives
+                  the n-gram id at each position of the text)
+        '''
+
+        starts = numpy.flatnonzero(valid)
+        groups = stem_keys[starts]
+        number = int(stem_keys.max()) + 1
+
+        count = numpy.bincount(groups, minlength=number)
+        present = count > 0
+        propers = numpy.bincount(groups, weights=all_proper[starts],
+                                 minlength=number)
+
+        # the representative of each n-gram is its first occurrence
+        first = numpy.full(number, len(valid), dtype=numpy.int64)
+        numpy.minimum.at(first, groups, starts)
+        first[~present] = 0
+
+        proper_rating = numpy.zeros(number)
+        mask = all_proper[starts]
+        numpy.maximum.at(proper_rating, groups[mask], rating[starts][mask])
+
+        group_rating = rating[first]
+        group_proper = all_proper[first]
+        frequent = present & (propers / numpy.maximum(count, 1) >= 0.5)
+        group_rating[frequent] = proper_rating[frequent]
+        group_proper[frequent] = True
+
+        # most common version, the earliest one in case of ties
+        radix = int(string_keys.max()) + 1
+        variants, inverse, variant_count = numpy.unique(
+            groups * radix + string_keys[starts],
+            return_inverse=True, return_counts=True)
+        variant_first = numpy.full(len(variants), len(valid), dtype=numpy.int64)
+        numpy.minimum.at(variant_first, inverse.reshape(-1), starts)
+        variant_group = variants // radix
+        order = numpy.lexsort((variant_first, -variant_count, variant_group))
+        sorted_groups = variant_group[order]
+        boundary = numpy.ones(len(order), bool)
+        boundary[1:] = sorted_groups[1:] != sorted_groups[:-1]
+        best = order[boundary]
+        spelling = numpy.zeros(number, dtype=numpy.int64)
+        spelling[variant_group[best]] = variant_first[best]
+
+        return {'size': size, 'keys': stem_keys, 'count': count,
+                'present': present, 'start': first, 'string': spelling,
+                'rating': group_rating, 'proper': group_proper}
+
+    def prune(self, levels):
+        '''
+        Discards redundant n-grams, with the same rules as L{Rater.__call__}
+
+        @param levels: the n-grams of each size, as returned by L{cluster}
+
+        @returns: for each level, a mask of the n-grams to be kept
+        '''
+
+        discarded = [numpy.zeros(len(level['count']), bool) for level in levels]
+
+        for level in levels[1:]:
+            size = level['size']
+            groups = numpy.flatnonzero(level['count'])
+            starts = level['start'][groups]
+            count = level['count'][groups]
+            proper = level['proper'][groups]
+            rated = level['rating'][groups] > 0.0
+
+            for length in range(1, size):
+                sub = levels[length - 1]
+                for offset in range(size - length + 1):
+                    s = sub['keys'][starts + offset]
+                    relative_freq = count / sub['count'][s]
+                    redundant = (((relative_freq == 1.0) & proper) |
+                                 ((relative_freq >= 0.5) & rated))
+                    discarded[length - 1][s[redundant]] = True
+                    discarded[size - 1][groups[~redundant]] = True
+
+        return [level['present'] & (level['rating'] > 0.0) & ~gone
+                for level, gone in zip(levels, discarded)]
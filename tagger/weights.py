@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Usage: weights.py <input .pkl dictionary> <output file>
+
+Compact binary format for dictionaries of weights
+
+The file is memory-mapped instead of being deserialized, so opening it is
+immediate and all the processes using the same dictionary share its pages.
+Layout (little-endian)::
+
+    header   magic, version, number of stems n, number of slots m
+    weights  n doubles, in the order of the sorted stems
+    offsets  n + 1 unsigned 32-bit offsets of the stems in the string table
+    slots    m unsigned 32-bit entries of an open-addressing hash table
+             (index of the stem + 1, or 0 for an empty slot)
+    strings  the UTF-8 encoded stems, sorted and concatenated
+'''
+
+import mmap
+import os
+import pickle
+import struct
+import sys
+import threading
+import zlib
+
+
+MAGIC = b'TGWT'
+VERSION = 1
+HEADER = struct.Struct('<4sIQQ')
+
+
+def write_weights(weights, path):
+    '''
+    @param weights: a dictionary of weights normalized in the interval [0,1]
+    @param path:    the name of the file where the weights should be saved
+    '''
+
+    stems = sorted(s.encode('utf-8') for s in weights)
+    n = len(stems)
+    m = 1
+    while m < 2 * n:
+        m *= 2
+
+    offsets = [0]
+    for s in stems:
+        offsets.append(offsets[-1] + len(s))
+
+    slots = [0] * m
+    for i, s in enumerate(stems):
+        j = zlib.crc32(s) & (m - 1)
+        while slots[j]:
+            j = (j + 1) & (m - 1)
+        slots[j] = i + 1
+
+    with open(path, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, VERSION, n, m))
+        out.write(struct.pack('<%dd' % n,
+                              *(weights[s.decode('utf-8')] for s in stems)))
+        out.write(struct.pack('<%dI' % (n + 1), *offsets))
+        out.write(struct.pack('<%dI' % m, *slots))
+        out.write(b''.join(stems))
+
+
+def convert(input_file, output_file):
+    '''
+    @param input_file:  a pickled dictionary of weights
+    @param output_file: the name of the file where the binary dictionary
+                        should be saved
+    '''
+
+    with open(input_file, 'rb') as fh:
+        weights = pickle.load(fh)
+    write_weights(weights, output_file)
+
+
+def load_weights(path):
+    '''
+    @param path: a dictionary of weights, either pickled or in the binary
+                 format
+
+    @returns: a L{MappedWeights} object or a dictionary, depending on the
+              format of the file
+    '''
+
+    with open(path, 'rb') as fh:
+        if fh.read(len(MAGIC)) == MAGIC:
+            return MappedWeights(path)
+        fh.seek(0)
+        return pickle.load(fh)
+
+
+class LazyWeights:
+    '''
+    Dictionary of weights that is only loaded from disk when first used
+
+    (pickling it only stores the path, so each worker process loads the
+    dictionary by itself, and only if it needs it)
+    '''
+
+    def __init__(self, path):
+        '''
+        @param path: a dictionary of weights, either pickled or in the binary
+                     format
+
+        @returns: a new L{LazyWeights} object
+        '''
+
+        self.path = path
+        self._weights = None
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        return (LazyWeights, (self.path,))
+
+    def load(self):
+        '''
+        @returns: the dictionary of weights, loading it if needed (only once,
+                  even if many threads need it at the same time)
+        '''
+
+        if self._weights is None:
+            with self._lock:
+                if self._weights is None:
+                    self._weights = load_weights(self.path)
+        return self._weights
+
+    def __len__(self):
+        return len(self.load())
+
+    def __contains__(self, stem):
+        return stem in self.load()
+
+    def __getitem__(self, stem):
+        return self.load()[stem]
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def get(self, stem, default=None):
+        return self.load().get(stem, default)
+
+    def keys(self):
+        return self.load().keys()
+
+    def items(self):
+        return self.load().items()
+
+
+class MappedWeights:
+    '''
+    Read-only dictionary of weights backed by a memory-mapped binary file
+
+    (it can be used wherever a dictionary of weights is expected; pickling it
+    only stores the path, so each worker process maps the same file)
+    '''
+
+    def __init__(self, path):
+        '''
+        @param path: a file written by L{write_weights}
+
+        @returns: a new L{MappedWeights} object
+        '''
+
+        self.path = path
+
+        with open(path, 'rb') as fh:
+            self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, n, m = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a dictionary of weights' % path)
+
+        self._size = n
+        self._slots_mask = m - 1
+
+        start = HEADER.size
+        view = memoryview(self._map)
+        self._weights = self._cast(view[start:start + 8 * n], 'd')
+        start += 8 * n
+        self._offsets = self._cast(view[start:start + 4 * (n + 1)], 'I')
+        start += 4 * (n + 1)
+        self._slots = self._cast(view[start:start + 4 * m], 'I')
+        self._strings = start + 4 * m
+        view.release()
+
+    def _cast(self, view, fmt):
+        if sys.byteorder == 'little':
+            return view.cast(fmt)
+        # on big-endian machines the table is copied and swapped
+        import array
+        table = array.array(fmt, view.tobytes())
+        table.byteswap()
+        return table
+
+    def __reduce__(self):
+        return (MappedWeights, (self.path,))
+
+    def _index(self, stem):
+        key = stem.encode('utf-8')
+        mask = self._slots_mask
+        slots = self._slots
+        offsets = self._offsets
+        strings = self._strings
+
+        j = zlib.crc32(key) & mask
+        while True:
+            entry = slots[j]
+            if not entry:
+                return -1
+            i = entry - 1
+            a = strings + offsets[i]
+            b = strings + offsets[i + 1]
+            if b - a == len(key) and self._map[a:b] == key:
+                return i
+            j = (j + 1) & mask
+
+    def _stem(self, i):
+        offsets = self._offsets
+        return self._map[self._strings + offsets[i]:
+                         self._strings + offsets[i + 1]].decode('utf-8')
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, stem):
+        return self._index(stem) >= 0
+
+    def __getitem__(self, stem):
+        i = self._index(stem)
+        if i < 0:
+            raise KeyError(stem)
+        return self._weights[i]
+
+    def get(self, stem, default=None):
+        i = self._index(stem)
+        if i < 0:
+            return default
+        return self._weights[i]
+
+    def __iter__(self):
+        return (self._stem(i) for i in range(self._size))
+
+    def keys(self):
+        return iter(self)
+
+    def items(self):
+        return ((self._stem(i), self._weights[i]) for i in range(self._size))
+
+    def close(self):
+        for table in (self._weights, self._offsets, self._slots):
+            if isinstance(table, memoryview):
+                table.release()
+        self._map.close()
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) != 3:
+        print(__doc__.strip().split('\n')[0])
+        exit(1)
+
+    convert(sys.argv[1], sys.argv[2])
+    print('Wrote %d bytes to %s' % (os.path.getsize(sys.argv[2]), sys.argv[2]))